@@ -9,14 +9,18 @@ import logging
 # Quiet Telethon connection spam (Connecting to... Disconnecting from...)
 logging.getLogger("telethon").setLevel(logging.WARNING)
 import asyncio
+import codecs
 import os
-import subprocess
+import signal
 import sys
+import time
 from pathlib import Path
 
 # Session in project dir — use separate agent session to avoid MCP lock
 PROJECT_DIR = Path(__file__).resolve().parent
 AGENT_SESSION_DIR = PROJECT_DIR / ".session-state-agent"
+PROFILE_DIR = PROJECT_DIR / ".vibe-profiles"
+LOG_DIR = PROJECT_DIR / ".vibe-logs"
 os.environ["XDG_STATE_HOME"] = str(AGENT_SESSION_DIR)
 
 # Use datasets for temp (avoid /tmp when root is full)
@@ -29,6 +33,18 @@ os.environ["TMP"] = str(TMP_BASE)
 from dotenv import load_dotenv
 load_dotenv(PROJECT_DIR / ".env")
 
+from telethon.tl import patched, types
+
+from mcp_telegram.types import Message, Messages
+
+from vibe_metrics import DROPPED, PHASE, RETRIES, ROUTES, log_summary_periodically, start_metrics_server, timed
+from vibe_profiling import LoopStallDetector, install_profile_signal, register_routes
+from vibe_io import read_text, run_io, run_subprocess, write_text
+from vibe_tasklog import TaskLog, TaskLogs
+from vibe_context import ConversationContext
+from vibe_send import new_key, send_text, send_texts
+from vibe_handoff import AgentProcess, HandedOff, control_socket_path, is_running, request_takeover, serve_control
+
 # Ensure PATH has ~/.local/bin for cursor/agent
 home = Path.home()
 local_bin = home / ".local" / "bin"
@@ -46,23 +62,29 @@ def is_bot_message(text: str) -> bool:
     return text.startswith(BOT_PREFIX) or any(text.startswith(p) for p in BOT_PATTERNS)
 
 
-def get_or_create_chat_id(workspace: Path, chat_file: str) -> str:
+def has_attachment(m) -> bool:
+    """A photo or file sent with the Telethon message m (a link preview's photo doesn't count)."""
+    return isinstance(m.media, (types.MessageMediaPhoto, types.MessageMediaDocument))
+
+
+def to_message(m) -> Message:
+    """mcp_telegram Message for m, without media unless it has a real attachment."""
+    msg = Message.from_message(m)
+    if msg.media is not None and not has_attachment(m):
+        msg.media = None
+    return msg
+
+
+async def get_or_create_chat_id(workspace: Path, chat_file: str) -> str:
     chat_path = workspace / chat_file
-    if chat_path.exists():
-        cid = chat_path.read_text().strip()
-        if cid:
-            return cid
-    result = subprocess.run(
-        ["cursor", "agent", "create-chat"],
-        capture_output=True,
-        text=True,
-        cwd=workspace,
-        env=env,
-    )
-    if result.returncode != 0:
-        raise RuntimeError(f"cursor agent create-chat failed: {result.stderr}")
-    chat_id = result.stdout.strip()
-    chat_path.write_text(chat_id)
+    cid = (await read_text(chat_path)).strip()
+    if cid:
+        return cid
+    returncode, stdout, stderr = await run_subprocess("cursor", "agent", "create-chat", cwd=workspace, env=env)
+    if returncode != 0:
+        raise RuntimeError(f"cursor agent create-chat failed: {stderr}")
+    chat_id = stdout.strip()
+    await write_text(chat_path, chat_id)
     return chat_id
 
 
@@ -73,45 +95,68 @@ def run_agent_env(workspace: Path, queue_path: Path) -> dict:
     return e
 
 
-async def run_agent(
+async def start_agent(
     instruction: str,
     workspace: Path,
     chat_id: str,
     dialog_id: str,
     queue_path: Path,
-) -> int:
-    """Run agent. Telegram client must be DISCONNECTED so the MCP server can use the session."""
-    queue_path.write_text("")  # Clear before run
+    exit_file: Path,
+    context_file: Path | None = None,
+) -> AgentProcess:
+    """Start the agent. Telegram client must be DISCONNECTED so the MCP server can use the session."""
+    await write_text(queue_path, "")  # Clear before run
     queue_name = queue_path.name
+    context_note = ""
+    if context_file is not None:
+        context_note = f"""
+Recent group messages and the results of earlier tasks are in {context_file.name} (updated just before this run). Read it for context instead of calling get_messages; fetch history only if you need something older.
+"""
 
     prompt = f"""REQUIRED: Report back to this group. Use send_message MCP tool with entity="{dialog_id}" (always use this entity, not Vibe). If it returns "Tool not found" or times out, use this fallback instead:
   echo "[bot] your message" >> {queue_name}
 Prefix every message with "[bot]". Send progress updates, summaries, findings, and completion notes. agent_vibe forwards {queue_name} to Telegram after you finish.
-
+{context_note}
 Execute this instruction:
 
 {instruction}"""
 
-    proc = await asyncio.create_subprocess_exec(
-        "cursor", "agent",
-        "--model", "composer-1.5",
-        "--print",
-        "--approve-mcps",
-        "--force",
-        "--sandbox", "disabled",
-        "--workspace", str(workspace),
-        "--resume", chat_id,
-        prompt,
-        stdout=asyncio.subprocess.PIPE,
-        stderr=asyncio.subprocess.STDOUT,
+    return await AgentProcess.spawn(
+        [
+            "cursor", "agent",
+            "--model", "composer-1.5",
+            "--print",
+            "--approve-mcps",
+            "--force",
+            "--sandbox", "disabled",
+            "--workspace", str(workspace),
+            "--resume", chat_id,
+            prompt,
+        ],
         cwd=workspace,
         env=run_agent_env(workspace, queue_path),
+        exit_file=exit_file,
     )
-    assert proc.stdout is not None
-    async for line in proc.stdout:
-        print(line.decode(errors="replace").rstrip())
-    await proc.wait()
-    return proc.returncode or 0
+
+
+async def follow_agent(agent: AgentProcess, task_log: TaskLog, echo: bool = True) -> int:
+    """Copy the agent's output to task_log (file + ring buffer) and, with echo, to our stdout.
+    Returns the exit code; raises HandedOff if the agent was handed to another process.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+    async def on_chunk(chunk: bytes):
+        # Log backpressure pauses reading from the pipe
+        await task_log.write(chunk)
+        if echo:
+            sys.stdout.write(decoder.decode(chunk))
+            sys.stdout.flush()
+
+    try:
+        await agent.follow(on_chunk)
+    finally:
+        await task_log.close()
+    return await agent.wait()
 
 
 async def main():
@@ -120,30 +165,75 @@ async def main():
     parser.add_argument("-w", "--workspace", default="/share/datasets/home/wendler/code", help="Workspace for agent")
     parser.add_argument("--chat-file", default=".vibe-agent-chat", help="File to persist chat ID")
     parser.add_argument("--queue", default=".vibe-send-queue", help="Queue file for fallback when MCP fails")
+    parser.add_argument("--context-file", default=".vibe-context.md", help="Recent-history digest written to the workspace before each run")
     parser.add_argument("-i", "--interval", type=int, default=1, help="Poll interval (seconds)")
+    parser.add_argument("--metrics-port", type=int, default=0, help="Serve /metrics on 127.0.0.1:PORT (0 = off)")
+    parser.add_argument("--metrics-interval", type=int, default=300, help="Print a metrics summary every N seconds (0 = off)")
+    parser.add_argument("--stall-threshold", type=float, default=0.5, help="Report event-loop stalls longer than N seconds (0 = off)")
+    parser.add_argument("--profile-seconds", type=float, default=30, help="Window sampled on SIGUSR1 (written to .vibe-profiles/)")
+    parser.add_argument("--echo", action=argparse.BooleanOptionalAction, default=True, help="Echo agent output to the terminal (always logged to .vibe-logs/)")
+    parser.add_argument("--pool", action="append", default=[], metavar="NAME",
+                        help="Also use session .session-state-pool-NAME (repeatable; see login_local.py --pool)")
+    parser.add_argument("--session-rate", type=float, default=3.0,
+                        help="Telegram ops per second per session, bursts of 10 (keep well above 1/--interval)")
+    parser.add_argument("--max-attachment-mb", type=float, default=100, help="Prefetch task attachments up to this size")
+    parser.add_argument("--takeover", action="store_true", help="Take over queue and running agent from the agent_vibe running for this dialog")
     args = parser.parse_args()
 
+    # Before any helper threads start, so they inherit the blocked SIGUSR1
+    install_profile_signal(PROFILE_DIR, args.profile_seconds)
+    if args.stall_threshold:
+        LoopStallDetector(asyncio.get_running_loop(), args.stall_threshold).start()
+    task_logs = TaskLogs(LOG_DIR / args.dialog.lstrip("-"))
+
+    def task_log_route(query):
+        task_id = query.get("id", [None])[0]
+        if "tail" in query:
+            log = task_logs.get(task_id)
+            if log is None:
+                return 404, "text/plain", "no such task in memory\n"
+            return 200, "text/plain; charset=utf-8", log.tail(int(query["tail"][0] or 0) or None)
+        path = task_logs.path(task_id)
+        if path is None:
+            return 404, "text/plain", "no such task log\n"
+        return 200, "text/plain; charset=utf-8", path.read_bytes()
+
+    control_path = control_socket_path(PROJECT_DIR, args.dialog)
+    if not args.takeover and await run_io(is_running, control_path):
+        print(f"agent_vibe is already running for {args.dialog}; restart with --takeover", file=sys.stderr)
+        sys.exit(1)
+    if args.metrics_interval:
+        asyncio.create_task(log_summary_periodically(args.metrics_interval))
+
     workspace = Path(args.workspace).resolve()
     queue_path = workspace / args.queue
-    chat_id = get_or_create_chat_id(workspace, args.chat_file)
+    pending_path = queue_path.with_name(queue_path.name + ".pending")  # Unsent queue lines, "key\ttext"
+    context_path = workspace / args.context_file
+    context = ConversationContext()
+    chat_id = await get_or_create_chat_id(workspace, args.chat_file)
 
-    from mcp_telegram.telegram import Telegram
+    from session_pool import SessionPool
 
-    tg_lock = asyncio.Lock()  # Serialize Telegram ops to avoid CancelledError races
     DB_LOCK_RETRIES = 10
     DB_LOCK_DELAY = 3  # seconds to wait for MCP to release session
+    FETCH_LIMIT = 20
+    LOG_COMMANDS = ("/tail", "/log")
+    TAIL_CHARS = 3500  # Telegram messages max out at 4096 characters
+    ATTACHMENT_DIR = ".vibe-attachments"  # In the workspace, one subdir per message id
 
     def is_db_locked(e: Exception) -> bool:
         return "database is locked" in str(e).lower() or "database_locked" in str(e).lower()
 
     # Retry create_client — SQLiteSession opens DB on init; MCP may hold the lock
-    tg = None
+    pool = None
     for attempt in range(DB_LOCK_RETRIES):
         try:
-            tg = Telegram()
-            tg.create_client(
+            # Each session serializes its own ops (per-session lock); the pool spreads load across them
+            pool = SessionPool.from_state_dirs(
+                [AGENT_SESSION_DIR, *(PROJECT_DIR / f".session-state-pool-{name}" for name in args.pool)],
                 api_id=os.environ.get("TELEGRAM_API_ID") or os.environ.get("API_ID"),
                 api_hash=os.environ.get("TELEGRAM_API_HASH") or os.environ.get("API_HASH"),
+                rate=args.session_rate,
             )
             break
         except Exception as e:
@@ -153,133 +243,423 @@ async def main():
             else:
                 raise
 
-    async def connect_fetch_disconnect():
-        async with tg_lock:
-            for attempt in range(DB_LOCK_RETRIES):
-                try:
-                    await tg.client.connect()
-                    if not await tg.client.is_user_authorized():
-                        raise RuntimeError("Not logged in. Run: uv run python login_local.py")
-                    entity = int(args.dialog) if args.dialog.lstrip("-").isdigit() else args.dialog
-                    try:
-                        result = await tg.get_messages(entity, limit=20)
-                    finally:
-                        await tg.client.disconnect()
-                    return entity, result
-                except Exception as e:
-                    if tg.client.is_connected():
-                        await tg.client.disconnect()
-                    if is_db_locked(e) and attempt < DB_LOCK_RETRIES - 1:
-                        await asyncio.sleep(DB_LOCK_DELAY)
-                        continue
-                    raise
+    entity = int(args.dialog) if args.dialog.lstrip("-").isdigit() else args.dialog
 
-    async def connect_send_disconnect(entity, msg):
-        async with tg_lock:
+    async def connect_run_disconnect(op, fn, primary=False):
+        """connect → fn(tg) → disconnect on the least-loaded pool session, retrying while its DB is locked.
+        Reads pass primary=True: message ids of a basic group differ per account (see session_pool).
+        """
+        async def on_session(session):
+            tg = session.tg
             for attempt in range(DB_LOCK_RETRIES):
                 try:
-                    await tg.client.connect()
+                    with timed("connect"):
+                        await tg.client.connect()
                     try:
-                        await tg.send_message(entity, msg)
+                        try:
+                            return await fn(tg)
+                        except ValueError as e:
+                            if "input entity" not in str(e):
+                                raise
+                            # A pool session that never saw the group: load its dialogs once to cache it
+                            await tg.client.get_dialogs()
+                            return await fn(tg)
                     finally:
                         await tg.client.disconnect()
-                    return
                 except Exception as e:
                     if tg.client.is_connected():
                         await tg.client.disconnect()
                     if is_db_locked(e) and attempt < DB_LOCK_RETRIES - 1:
+                        RETRIES.inc(op=op)
                         await asyncio.sleep(DB_LOCK_DELAY)
                         continue
                     raise
 
-    queue: list[tuple[int, str]] = []
+        return await pool.run(op, on_session, primary)
+
+    async def connect_fetch_disconnect():
+        async def fetch(tg):
+            with timed("authorize"):
+                if not await tg.client.is_user_authorized():
+                    raise RuntimeError("Not logged in. Run: uv run python login_local.py")
+            with timed("fetch"):
+                # Not tg.get_messages: its Message.media also covers link previews (see to_message)
+                msgs = await tg.client.get_messages(entity, limit=FETCH_LIMIT)
+            return Messages(
+                messages=[
+                    to_message(m) for m in msgs
+                    if isinstance(m, patched.Message) and not isinstance(m, patched.MessageService | patched.MessageEmpty)
+                    and m.date is not None
+                ],
+                dialog=None,
+            )
+
+        return await connect_run_disconnect("fetch", fetch, primary=True)
+
+    async def connect_send_disconnect(entity, msg, file_path=None, key=None):
+        """Send msg; text sends carry an idempotency key, so the lock and reconnect retries can't duplicate it."""
+        key = key or new_key()
+
+        async def send(tg):
+            with timed("send"):
+                if file_path:
+                    await tg.send_message(entity, msg, file_path=file_path)
+                else:
+                    await send_text(tg.client, entity, msg, key)
+
+        await connect_run_disconnect("send", send)
+
+    async def prefetch_attachments(ids: list[int]) -> dict[int, str]:
+        """Download the media of messages `ids` concurrently into workspace/.vibe-attachments/<id>/.
+        Returns {message_id: local path}; a failed download raises in its slot's place (see process_queue).
+        """
+        async def download(tg):
+            msgs = await tg.client.get_messages(entity, ids=ids)  # One request for all of them
+
+            async def one(m):
+                target = workspace / ATTACHMENT_DIR / str(m.id)
+                await run_io(lambda: target.mkdir(parents=True, exist_ok=True))
+                return await m.download_media(file=target)
+
+            found = [m for m in msgs if m is not None and has_attachment(m)]
+            with timed("attachments"):
+                paths = await asyncio.gather(*(one(m) for m in found), return_exceptions=True)
+            return {m.id: p for m, p in zip(found, paths)}
+
+        return await connect_run_disconnect("download", download, primary=True)
+
+    queue: list[tuple[int, str, float]] = []  # (message_id, text, enqueued at)
+    attachments: dict[int, asyncio.Task | str] = {}  # message_id → prefetch task, or why it was not prefetched
     seen_ids: set[int] = set()
     last_processed_id = 0
     initialized = False
     processing = False
+    handing_off = False  # Set once a --takeover process asked for our state
+    current: tuple[str, AgentProcess, TaskLog, str] | None = None  # Task id, agent, log, instruction while the agent runs
 
     async def fetch_and_enqueue():
         nonlocal last_processed_id, initialized
-        if processing:
+        if processing or handing_off:
             return  # Skip fetch while agent runs — MCP holds the session
         try:
-            entity, result = await connect_fetch_disconnect()
+            result = await connect_fetch_disconnect()
             raw = list(reversed(result.messages)) if result.messages else []
+            context.add_messages(raw)
             if not initialized:
                 last_processed_id = max(0, *(m.message_id for m in raw)) if raw else 0
                 initialized = True
                 return
+            if len(raw) == FETCH_LIMIT and raw[0].message_id > last_processed_id:
+                # Whole window is new: anything older than raw[0] that we never saw is lost
+                DROPPED.inc(reason="fetch_window")
+                print(f"Warning: >{FETCH_LIMIT} new messages since last fetch, older ones skipped", file=sys.stderr)
+            to_download = []
             for msg in raw:
                 if msg.message_id <= last_processed_id or msg.message_id in seen_ids:
                     continue
                 text = (msg.message or "").strip()
-                if not text or is_bot_message(text):
+                if (not text and msg.media is None) or is_bot_message(text):
                     continue
                 seen_ids.add(msg.message_id)
                 last_processed_id = max(last_processed_id, msg.message_id)
-                queue.append((msg.message_id, text))
+                if text and text.split()[0] in LOG_COMMANDS:
+                    asyncio.create_task(handle_log_command(text))
+                    continue
+                if msg.media is not None:
+                    size = msg.media.file_size or 0
+                    if size > args.max_attachment_mb * 2**20:
+                        attachments[msg.message_id] = f"not prefetched ({size / 2**20:.0f} MB > --max-attachment-mb)"
+                    else:
+                        to_download.append(msg.message_id)
+                queue.append((msg.message_id, text or "[attachment]", time.monotonic()))
                 asyncio.create_task(process_queue())
+            if to_download:
+                # Starts before process_queue gets to run; it awaits the downloads before starting the agent
+                download = asyncio.create_task(prefetch_attachments(to_download))
+                for message_id in to_download:
+                    attachments[message_id] = download
         except asyncio.CancelledError:
             raise
         except Exception as e:
             print(f"Fetch error: {e}", file=sys.stderr)
 
-    entity = int(args.dialog) if args.dialog.lstrip("-").isdigit() else args.dialog
+    async def handle_log_command(text: str):
+        """/tail [task_id] sends the last lines of a task's output, /log [task_id] the full log file."""
+        cmd, *rest = text.split()
+        task_id = rest[0] if rest else None
+        try:
+            if cmd == "/tail":
+                log = task_logs.get(task_id)
+                if log is None:
+                    await connect_send_disconnect(entity, f"{BOT_PREFIX} No output in memory for task {task_id or '(latest)'}")
+                    return
+                tail = log.tail(TAIL_CHARS * 4)[-TAIL_CHARS:]
+                await connect_send_disconnect(entity, f"{BOT_PREFIX} Task {log.task_id} tail:\n{tail or '(no output)'}")
+            else:
+                path = await run_io(task_logs.path, task_id)
+                if path is None:
+                    await connect_send_disconnect(entity, f"{BOT_PREFIX} No log for task {task_id or '(latest)'}")
+                    return
+                await connect_send_disconnect(entity, f"{BOT_PREFIX} Log: {path.name}", file_path=[str(path)])
+        except Exception as e:
+            print(f"Log command failed: {e}", file=sys.stderr)
+
+    async def attachment_result(message_id: int) -> str | None:
+        """Local path of message_id's prefetched attachment, or why there is none (None: no attachment)."""
+        pending = attachments.pop(message_id, None)
+        if pending is None or isinstance(pending, str):
+            return pending
+        try:
+            with timed("attachment_wait"):
+                result = (await pending).get(message_id) or "not found"
+        except Exception as e:
+            result = e
+        if isinstance(result, Exception):
+            return f"download failed ({type(result).__name__}: {result})"
+        return result
+
+    async def attachment_notes(batch) -> list[str]:
+        """One line per attachment in batch: its local path, or why the agent has to fetch it itself."""
+        notes = []
+        for message_id, _, _ in batch:
+            result = await attachment_result(message_id)
+            if result is None:
+                continue
+            if result.startswith(str(workspace)):
+                notes.append(f"- message {message_id}: {result}")
+            else:
+                notes.append(
+                    f"- message {message_id}: {result}; use download_media with entity=\"{args.dialog}\", message_id={message_id}"
+                )
+        return notes
 
     async def process_queue():
         nonlocal processing
-        if processing or not queue:
+        if processing or handing_off or not queue:
             return
         processing = True
         # Merge all queued messages into one todo (messages sent while agent was busy)
-        batch: list[tuple[int, str]] = []
+        batch: list[tuple[int, str, float]] = []
         while queue:
             batch.append(queue.pop(0))
-        merged = "\n".join(f"{i+1}. {t}" for i, (_, t) in enumerate(batch))
+        now = time.monotonic()
+        for _, _, enqueued_at in batch:
+            PHASE.observe(now - enqueued_at, phase="queue_wait")
+        merged = "\n".join(f"{i+1}. {t}" for i, (_, t, _) in enumerate(batch))
         if len(batch) > 1:
             merged = f"Combined {len(batch)} messages into one todo:\n\n{merged}"
         preview = merged[:80] + "..." if len(merged) > 80 else merged
-        print(f"\n📩 Processing: {preview}\n")
+        task_id = str(batch[0][0])
+        print(f"\n📩 Processing task {task_id}: {preview}\n")
         try:
-            await connect_send_disconnect(entity, f"{BOT_PREFIX} Starting...")
-            code = await run_agent(merged, workspace, chat_id, args.dialog, queue_path)
+            await connect_send_disconnect(entity, f"{BOT_PREFIX} Starting... (task {task_id})", key=f"{args.dialog}:{task_id}:start")
+            notes = await attachment_notes(batch)
+            if notes:
+                merged += "\n\nAttachments (already downloaded to the workspace):\n" + "\n".join(notes)
+            with timed("context"):
+                await context.write(context_path)
+            agent = await start_agent(
+                merged, workspace, chat_id, args.dialog, queue_path, task_logs.log_dir / f"task-{task_id}.exit",
+                context_path,
+            )
+        except Exception as e:
+            await report_error(e)
+            processing = False
+            if queue:
+                asyncio.create_task(process_queue())
+            return
+        await finish_task(task_id, agent, task_logs.open(task_id), merged)
+
+    async def finish_task(task_id: str, agent: AgentProcess, task_log: TaskLog, instruction: str):
+        """Follow a started (or adopted) agent to the end, forward its queue file and report."""
+        nonlocal processing, current
+        handed_off = False
+        try:
+            current = (task_id, agent, task_log, instruction)
+            try:
+                with timed("agent_run"):
+                    code = await follow_agent(agent, task_log, echo=args.echo)
+            finally:
+                current = None
+            context.add_outcome(task_id, instruction, code, task_log.tail(600))
             await asyncio.sleep(DB_LOCK_DELAY * 2)  # Extra wait for MCP to release session
-            # Forward queued messages (agent used echo >> queue when MCP failed)
-            if queue_path.exists():
-                lines = [l.strip() for l in queue_path.read_text().splitlines() if l.strip()]
-                for line in lines:
+            # Forward queued messages (agent used echo >> queue when MCP failed), after any left
+            # over from an earlier task
+            pending = [tuple(l.split("\t", 1)) for l in (await read_text(pending_path)).splitlines() if "\t" in l]
+            lines = [l.strip() for l in (await read_text(queue_path)).splitlines() if l.strip()]
+            # Keyed by task and line: all lines go out in one pipelined batch, and resending
+            # (after a reconnect, or a handoff before the file was cleared) can't duplicate them
+            items = pending + [
+                (f"{args.dialog}:{task_id}:forward:{i}", line if line.startswith(BOT_PREFIX) else f"{BOT_PREFIX} {line}")
+                for i, line in enumerate(lines)
+            ]
+            if items:
+                with timed("forward"):
+                    sent: set[str] = set()  # Shared across pool failovers, so lines already out aren't resent
                     try:
-                        msg = line if line.startswith(BOT_PREFIX) else f"{BOT_PREFIX} {line}"
-                        await connect_send_disconnect(entity, msg)
+                        errors = await connect_run_disconnect("send", lambda tg: send_texts(tg.client, entity, items, sent))
                     except Exception as e:
-                        print(f"Failed to send queued message: {e}", file=sys.stderr)
-                queue_path.write_text("")
+                        # Flood-limited or offline: keep the unsent lines, with their keys, for the next forward
+                        unsent = [(key, text) for key, text in items if key not in sent]
+                        print(f"Failed to forward queued messages, keeping {len(unsent)}: {e}", file=sys.stderr)
+                        await write_text(pending_path, "".join(f"{key}\t{text}\n" for key, text in unsent))
+                    else:
+                        for err in errors:
+                            if err is not None:
+                                DROPPED.inc(reason="forward_failed")
+                                print(f"Failed to send queued message: {err}", file=sys.stderr)
+                        await write_text(pending_path, "")
+                    await write_text(queue_path, "")
             status = f"{BOT_PREFIX} Done ✓" if code == 0 else f"{BOT_PREFIX} Error (exit {code})"
-            await connect_send_disconnect(entity, status)
+            await connect_send_disconnect(entity, status, key=f"{args.dialog}:{task_id}:done")
             print(f"\n✓ Agent finished (exit {code})\n")
+        except HandedOff:
+            handed_off = True  # The new process finishes this task; stay "processing" until we exit
         except Exception as e:
-            print(f"Error: {e}", file=sys.stderr)
-            if not is_db_locked(e):
-                try:
-                    await connect_send_disconnect(entity, f"{BOT_PREFIX} Error: {e}")
-                except Exception:
-                    pass
+            await report_error(e)
         finally:
-            processing = False
-            if queue:
+            if not handed_off:
+                processing = False
+                if queue:
+                    asyncio.create_task(process_queue())
+
+    async def report_error(e: Exception):
+        print(f"Error: {e}", file=sys.stderr)
+        if not is_db_locked(e):
+            try:
+                await connect_send_disconnect(entity, f"{BOT_PREFIX} Error: {e}")
+            except Exception:
+                pass
+
+    def adopt(agent_state: dict, fd: int, popen=None):
+        """Continue following an agent started by another process (or by us, after a failed handoff)."""
+        nonlocal processing
+        task_id = agent_state["task_id"]
+        agent = AgentProcess(agent_state["pid"], fd, Path(agent_state["exit_file"]), popen)
+        processing = True
+        print(f"Adopted agent for task {task_id} (pid {agent.pid})")
+        asyncio.create_task(finish_task(task_id, agent, task_logs.open(task_id), agent_state.get("instruction", "")))
+
+    metrics_server = None
+    handed_popen = None  # Our Popen of a handed-off agent, to re-adopt it if the handoff fails
+    stop = asyncio.Event()
+
+    async def handoff() -> tuple[dict, list[int]]:
+        """Stop ingesting and return our state (+ the agent's pipe) for the process taking over."""
+        nonlocal handing_off, handed_popen
+        handing_off = True
+        print("Takeover requested, handing off...", file=sys.stderr)
+        fds, agent_state = [], None
+        while True:
+            if current is not None:
+                task_id, agent, task_log, instruction = current
+                fd = await agent.detach()
+                if fd is not None:  # Else it just finished: let this process forward and report first
+                    await task_log.close()
+                    fds = [fd]
+                    agent_state = {
+                        "task_id": task_id, "pid": agent.pid, "exit_file": str(agent.exit_file), "instruction": instruction,
+                    }
+                    handed_popen = agent.popen
+                    break
+            elif not processing:
+                break
+            await asyncio.sleep(0.2)  # Between "Starting..." and the agent start, or forwarding after it
+        for session in pool.sessions:
+            await session.lock.acquire()  # Wait out in-flight ops; the session files are the new process's now
+        # Only now can no fetch add entries. Downloads that haven't got a session yet never will here
+        for message_id, pending in list(attachments.items()):
+            if isinstance(pending, asyncio.Task):
+                if pending.done():
+                    attachments[message_id] = await attachment_result(message_id) or "not found"
+                else:
+                    pending.cancel()
+                    attachments[message_id] = "not prefetched (agent_vibe restarted)"
+        if metrics_server is not None:
+            await run_io(metrics_server.shutdown)
+            metrics_server.server_close()
+        now = time.monotonic()
+        state = {
+            "queue": [[message_id, text, now - enqueued_at] for message_id, text, enqueued_at in queue],
+            "seen_ids": sorted(seen_ids),
+            "last_processed_id": last_processed_id,
+            "initialized": initialized,
+            "attachments": {str(k): v for k, v in attachments.items() if isinstance(v, str)},
+            "agent": agent_state,
+            "context": context.state(),
+        }
+        return state, fds
+
+    async def resume(state: dict, fds: list[int]):
+        nonlocal handing_off, metrics_server
+        for session in pool.sessions:
+            session.lock.release()
+        if args.metrics_port:
+            metrics_server = start_metrics_server(args.metrics_port)
+        handing_off = False
+        if state["agent"]:
+            adopt(state["agent"], fds[0], handed_popen)
+        elif queue:
+            asyncio.create_task(process_queue())
+
+    if args.takeover:
+        if await run_io(is_running, control_path):
+            state, fds = await request_takeover(control_path)
+            now = time.monotonic()
+            queue.extend((message_id, text, now - age) for message_id, text, age in state["queue"])
+            seen_ids.update(state["seen_ids"])
+            last_processed_id = state["last_processed_id"]
+            initialized = state["initialized"]
+            attachments.update({int(k): v for k, v in state["attachments"].items()})
+            context.load_state(state["context"])
+            print(f"Took over: {len(queue)} queued, last message {last_processed_id}")
+            if state["agent"]:
+                adopt(state["agent"], fds[0])
+            elif queue:
                 asyncio.create_task(process_queue())
-
+        else:
+            print(f"--takeover: no agent_vibe running for {args.dialog}, starting fresh", file=sys.stderr)
+
+    if args.metrics_port:
+        register_routes()
+        ROUTES["/task-log"] = task_log_route
+        metrics_server = start_metrics_server(args.metrics_port)
+
+    async def control():
+        await serve_control(control_path, handoff, resume)
+        stop.set()
+
+    def on_signal(sig: int):
+        """SIGTERM/SIGHUP (kill, screen closed): the agent runs in its own session, so stop it ourselves."""
+        if current is not None and not handing_off:
+            current[1].kill()
+        loop.remove_signal_handler(sig)  # Back to the default action: die as before
+        os.kill(os.getpid(), sig)
+
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGHUP):
+        loop.add_signal_handler(sig, on_signal, sig)
+
+    asyncio.create_task(control())
     await fetch_and_enqueue()
 
     print("Vibe → Cursor Agent")
     print(f"Dialog: {args.dialog}")
     print(f"Workspace: {workspace}")
     print(f"Shared chat: {chat_id}")
+    print(f"Sessions: {pool.status()}")
     print(f"Fetching every {args.interval}s. Press Ctrl+C to stop.\n")
 
-    while True:
-        await asyncio.sleep(args.interval)
-        await fetch_and_enqueue()
+    try:
+        while not stop.is_set():
+            try:
+                await asyncio.wait_for(stop.wait(), args.interval)
+            except asyncio.TimeoutError:
+                await fetch_and_enqueue()
+        print("Handed off to the new process, exiting.")
+    finally:
+        if current is not None and not stop.is_set():
+            current[1].kill()  # Ctrl+C: the agent runs in its own session, so stop it ourselves
 
 
 if __name__ == "__main__":
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Benchmark get_messages result building: upstream Message models vs projected dicts.
+
+Runs offline on synthetic Telethon messages (no session needed); times building and
+serialising the tool result and measures peak memory while it is held.
+
+Usage:
+  uv run python bench_get_messages.py
+  uv run python bench_get_messages.py -n 50000 -r 5
+"""
+import argparse
+import random
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+
+from telethon.tl import patched, types
+
+from mcp_telegram.types import Message, Messages
+
+from message_page import project, resolve_fields
+from run_mcp_reconnect import MessagePage
+
+
+def synthetic_messages(n: int) -> list:
+    rnd = random.Random(0)
+    now = datetime.now(timezone.utc)
+    peer = types.PeerChannel(1234567890)
+    out = []
+    for i in range(n, 0, -1):
+        out.append(patched.Message(
+            id=i,
+            peer_id=peer,
+            date=now - timedelta(minutes=n - i),
+            message=" ".join(rnd.choice(("build", "the", "agent", "ok", "fix", "test", "deploy")) for _ in range(rnd.randint(3, 60))),
+            out=i % 3 == 0,
+            from_id=types.PeerUser(1000 + i % 7),
+            reply_to=types.MessageReplyHeader(reply_to_msg_id=i - 1) if i % 4 == 0 else None,
+        ))
+    return out
+
+
+def upstream(msgs) -> str:
+    return Messages(messages=[Message.from_message(m) for m in msgs], dialog=None).model_dump_json()
+
+
+def projected(msgs, fields) -> str:
+    to_dict = project(resolve_fields(fields))
+    return MessagePage(messages=[to_dict(m) for m in msgs]).model_dump_json()
+
+
+def measure(fn, msgs, repeats: int) -> tuple[float, int, int]:
+    """(best seconds, peak bytes, output bytes)"""
+    best = float("inf")
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        out = fn(msgs)
+        best = min(best, time.perf_counter() - t0)
+    tracemalloc.start()
+    out = fn(msgs)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak, len(out)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark get_messages result building")
+    parser.add_argument("-n", type=int, default=10_000, help="Messages per call")
+    parser.add_argument("-r", "--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    msgs = synthetic_messages(args.n)
+    cases = [
+        ("upstream Message models", upstream),
+        ("projected dicts, all fields", lambda ms: projected(ms, None)),
+        ("projected dicts, id,date,sender,text", lambda ms: projected(ms, ["id", "date", "sender", "text"])),
+        ("projected dicts, id,text", lambda ms: projected(ms, ["id", "text"])),
+    ]
+    print(f"{args.n} messages, best of {args.repeats}")
+    print(f"{'path':36} {'time ms':>9} {'peak MiB':>9} {'output KiB':>11}")
+    for name, fn in cases:
+        seconds, peak, size = measure(fn, msgs, args.repeats)
+        print(f"{name:36} {seconds * 1000:9.1f} {peak / 2**20:9.1f} {size / 1024:11.0f}")
+
+
+if __name__ == "__main__":
+    main()
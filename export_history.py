@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""
+Export the complete history of one or more dialogs to JSONL (or Parquet) in constant memory.
+
+Pages of 100 messages are fetched oldest → newest and appended to the output; after every
+page (JSONL) or part file (Parquet) a checkpoint is written, so an interrupted export resumes
+where it stopped. Dialogs are exported concurrently under a shared rate budget.
+
+Usage:
+  uv run python export_history.py -d -5150901335 -o exports/
+  uv run python export_history.py -d -5150901335 -d some_channel --media -c 3
+  uv run python export_history.py -d some_channel --format parquet   # needs: uv pip install pyarrow
+
+Library:
+  from export_history import export_dialog, export_dialogs
+  await export_dialogs(client, ["-5150901335", "some_channel"], Path("exports"))
+
+Reads .session-state-agent by default (--session to pick another) through a read-only
+snapshot, so it can run next to agent_vibe and the MCP server without locking their session.
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import sys
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+PROJECT_DIR = Path(__file__).resolve().parent
+load_dotenv(PROJECT_DIR / ".env")
+
+from telethon import TelegramClient
+from telethon.tl import patched
+
+from mcp_telegram.types import Media
+from mcp_telegram.utils import parse_entity
+
+from session_pool import RateBudget
+from vibe_io import SnapshotSession, run_io
+from vibe_metrics import FLOODWAITS, is_flood_wait, timed
+
+PAGE_SIZE = 100  # Telegram's maximum per GetHistory request
+PARQUET_ROWS_PER_PART = 50_000
+
+
+def message_record(m, media: bool = False) -> dict:
+    """Flat, JSON-serializable record for one message."""
+    rec = {
+        "id": m.id,
+        "date": m.date.isoformat() if m.date else None,
+        "sender_id": m.sender_id,
+        "text": m.message or None,
+        "reply_to": getattr(m.reply_to, "reply_to_msg_id", None),
+        "outgoing": bool(m.out),
+        "edit_date": m.edit_date.isoformat() if getattr(m, "edit_date", None) else None,
+        "grouped_id": getattr(m, "grouped_id", None),
+        "action": type(m.action).__name__ if isinstance(m, patched.MessageService) else None,
+    }
+    if media:
+        info = Media.from_message(m) if getattr(m, "media", None) else None
+        rec["media"] = info.model_dump() if info else None
+    return rec
+
+
+def _checkpoint_path(out: Path) -> Path:
+    return out.with_name(out.name + ".ckpt.json")
+
+
+def _new_checkpoint() -> dict:
+    return {"last_id": 0, "count": 0, "bytes": 0, "parts": 0, "done": False}
+
+
+def _load_checkpoint(out: Path) -> dict:
+    try:
+        return json.loads(_checkpoint_path(out).read_text())
+    except FileNotFoundError:
+        return _new_checkpoint()
+
+
+def _save_checkpoint(out: Path, state: dict) -> None:
+    path = _checkpoint_path(out)
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(json.dumps(state))
+    os.replace(tmp, path)
+
+
+class JsonlSink:
+    """Append-only JSONL file; a resume truncates it back to the checkpointed size."""
+
+    suffix = ".jsonl"
+
+    def __init__(self, out: Path, state: dict):
+        self.out = out
+        self.state = state
+        self.f = None
+
+    def resumable(self) -> bool:
+        """False if the output is missing or shorter than the checkpoint says (deleted or replaced)."""
+        try:
+            return self.out.stat().st_size >= self.state["bytes"]
+        except FileNotFoundError:
+            return self.state["bytes"] == 0
+
+    def _open(self):
+        self.f = open(self.out, "ab")
+        self.f.truncate(self.state["bytes"])  # Drop a page written after the last checkpoint
+        self.f.seek(self.state["bytes"])
+
+    async def write(self, records: list[dict]) -> bool:
+        """Write one page; returns True when the page is durable and can be checkpointed."""
+        data = "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records).encode()
+
+        def write_sync():
+            if self.f is None:
+                self._open()
+            self.f.write(data)
+            self.f.flush()
+            os.fsync(self.f.fileno())
+            return self.f.tell()
+
+        self.state["bytes"] = await run_io(write_sync)
+        return True
+
+    async def close(self) -> None:
+        if self.f is not None:
+            await run_io(self.f.close)
+            self.f = None
+
+
+class ParquetSink:
+    """Directory of part-NNNNN.parquet files, one per PARQUET_ROWS_PER_PART rows."""
+
+    suffix = ".parquet"
+
+    def __init__(self, out: Path, state: dict):
+        try:
+            import pyarrow  # noqa: F401
+            import pyarrow.parquet  # noqa: F401
+        except ImportError:
+            raise RuntimeError("--format parquet needs pyarrow: uv pip install pyarrow") from None
+        self.out = out
+        self.state = state
+        self.rows: list[dict] = []
+
+    def resumable(self) -> bool:
+        """False if a checkpointed part file is missing."""
+        return all((self.out / f"part-{i:05d}.parquet").exists() for i in range(self.state["parts"]))
+
+    async def write(self, records: list[dict], final: bool = False) -> bool:
+        self.rows.extend(records)
+        if not self.rows or (len(self.rows) < PARQUET_ROWS_PER_PART and not final):
+            return False  # Not durable yet; a resume refetches these rows
+
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        rows, self.rows = self.rows, []
+        for r in rows:
+            if "media" in r:  # Nested dicts become a JSON column
+                r["media"] = json.dumps(r["media"]) if r["media"] else None
+        path = self.out / f"part-{self.state['parts']:05d}.parquet"
+
+        def write_sync():
+            self.out.mkdir(parents=True, exist_ok=True)
+            pq.write_table(pa.Table.from_pylist(rows), path)
+
+        await run_io(write_sync)
+        self.state["parts"] += 1
+        return True
+
+    async def close(self) -> None:
+        await self.write([], final=True)
+
+
+async def export_dialog(
+    client: TelegramClient,
+    entity: str | int,
+    out_dir: Path,
+    fmt: str = "jsonl",
+    media: bool = False,
+    budget: RateBudget | None = None,
+) -> int:
+    """Export one dialog's full history to out_dir/<entity>.<fmt>; returns the message count.
+
+    Safe to call again after an interruption: it continues from the last checkpoint
+    (and after a complete export, appends messages sent since).
+    """
+    name = re.sub(r"[^\w@.-]", "_", str(entity))
+    sink_cls = ParquetSink if fmt == "parquet" else JsonlSink
+    out = out_dir / f"{name}{sink_cls.suffix}"
+    await run_io(lambda: out_dir.mkdir(parents=True, exist_ok=True))
+    state = await run_io(_load_checkpoint, out)  # After a finished export this only picks up new messages
+
+    sink = sink_cls(out, state)
+    if not await run_io(sink.resumable):
+        print(f"{name}: {out} doesn't match its checkpoint, starting over", file=sys.stderr)
+        state.clear()
+        state.update(_new_checkpoint())
+    last_id = state["last_id"]  # Newest id fetched; ahead of the checkpoint while Parquet rows are buffered
+    pages = 0
+    try:
+        while True:
+            if budget:
+                await budget.acquire()
+            try:
+                with timed("export_page"):
+                    page = await client.get_messages(entity, limit=PAGE_SIZE, offset_id=last_id, reverse=True)
+            except Exception as e:
+                if not is_flood_wait(e):
+                    raise
+                FLOODWAITS.inc(op="export")
+                print(f"{name}: FloodWait {e.seconds}s", file=sys.stderr)
+                await asyncio.sleep(e.seconds)
+                continue
+            if not page:
+                break
+            last_id = page[-1].id
+            records = [message_record(m, media) for m in page if not isinstance(m, patched.MessageEmpty)]
+            state["count"] += len(records)
+            if await sink.write(records):
+                # Only what is on disk goes into the checkpoint
+                state["last_id"] = last_id
+                await run_io(_save_checkpoint, out, state)
+            pages += 1
+            if pages % 50 == 0:
+                print(f"{name}: {state['count']} messages (id {last_id})", file=sys.stderr)
+            if len(page) < PAGE_SIZE:
+                break
+        await sink.close()
+    finally:
+        if sink_cls is JsonlSink:
+            await sink.close()
+    state.update(last_id=last_id, done=True)
+    await run_io(_save_checkpoint, out, state)
+    print(f"{name}: done, {state['count']} messages → {out}", file=sys.stderr)
+    return state["count"]
+
+
+async def export_dialogs(
+    client: TelegramClient,
+    entities: list[str | int],
+    out_dir: Path,
+    fmt: str = "jsonl",
+    media: bool = False,
+    concurrency: int = 3,
+    rate: float = 2.0,
+) -> dict:
+    """Export several dialogs concurrently; all pages share one rate budget.
+
+    Returns {entity: message count or the exception that stopped it}.
+    """
+    out_dir.mkdir(parents=True, exist_ok=True)
+    budget = RateBudget(rate, burst=concurrency)
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(entity):
+        async with sem:
+            return await export_dialog(client, entity, out_dir, fmt, media, budget)
+
+    results = await asyncio.gather(*(one(e) for e in entities), return_exceptions=True)
+    return dict(zip(entities, results))
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Export Telegram dialog history")
+    parser.add_argument("-d", "--dialog", action="append", required=True, help="Dialog ID or username (repeatable)")
+    parser.add_argument("-o", "--out", default="exports", help="Output directory")
+    parser.add_argument("--format", choices=("jsonl", "parquet"), default="jsonl")
+    parser.add_argument("--media", action="store_true", help="Include media metadata (no downloads)")
+    parser.add_argument("-c", "--concurrency", type=int, default=3, help="Dialogs exported in parallel")
+    parser.add_argument("--rate", type=float, default=2.0, help="History requests per second, all dialogs together")
+    parser.add_argument("--session", default=".session-state-agent", help="Session dir (relative to the project)")
+    args = parser.parse_args()
+
+    api_id = os.environ.get("TELEGRAM_API_ID") or os.environ.get("API_ID")
+    api_hash = os.environ.get("TELEGRAM_API_HASH") or os.environ.get("API_HASH")
+    if not api_id or not api_hash:
+        print("Error: Set TELEGRAM_API_ID and TELEGRAM_API_HASH in .env", file=sys.stderr)
+        sys.exit(1)
+
+    session_path = PROJECT_DIR / args.session / "mcp-telegram" / "session"
+    client = TelegramClient(SnapshotSession(str(session_path)), int(api_id), api_hash, receive_updates=False)
+    await client.connect()
+    if not await client.is_user_authorized():
+        print("Not logged in. Run: uv run python login_local.py --agent", file=sys.stderr)
+        sys.exit(1)
+    try:
+        results = await export_dialogs(
+            client, [parse_entity(d) for d in args.dialog], Path(args.out), args.format, args.media,
+            args.concurrency, args.rate,
+        )
+    finally:
+        await client.disconnect()
+    failed = {e: r for e, r in results.items() if isinstance(r, BaseException)}
+    for e, err in failed.items():
+        print(f"{e}: failed: {err} (run again to resume)", file=sys.stderr)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -3,7 +3,7 @@
 List all Telegram dialogs (chats, groups, channels) with their IDs.
 Use this to find a group ID when @userinfobot doesn't work.
 
-Run when agent_vibe is idle (or stop it first) to avoid session lock.
+Reads a snapshot of the agent session, so agent_vibe can keep running.
   uv run python list_dialogs.py
 """
 import asyncio
@@ -15,7 +15,6 @@ from dotenv import load_dotenv
 load_dotenv()
 
 PROJECT_DIR = Path(__file__).resolve().parent
-# Try agent session first; if "database is locked", stop agent_vibe and run again
 os.environ["XDG_STATE_HOME"] = str(PROJECT_DIR / ".session-state-agent")
 
 api_id = os.environ.get("TELEGRAM_API_ID") or os.environ.get("API_ID")
@@ -25,25 +24,29 @@ if not api_id or not api_hash:
     sys.exit(1)
 
 from telethon import TelegramClient
+from telethon.errors import UnauthorizedError
 from telethon.utils import get_peer_id
 
+from vibe_io import SnapshotSession
+
 SESSION_DIR = Path(os.environ["XDG_STATE_HOME"]) / "mcp-telegram"
 session_path = SESSION_DIR / "session"
 
 
 async def main():
-    client = TelegramClient(str(session_path), int(api_id), api_hash)
+    client = TelegramClient(SnapshotSession(str(session_path)), int(api_id), api_hash, receive_updates=False)
     await client.connect()
-    if not await client.is_user_authorized():
+    try:
+        print("Dialogs (groups/channels have negative IDs):\n")
+        async for d in client.iter_dialogs():
+            name = (d.name or d.title or "?")
+            eid = get_peer_id(d.entity)
+            print(f"  {eid}\t{name}")
+    except UnauthorizedError:
         print("Not logged in. Run: uv run python login_local.py --agent", file=sys.stderr)
         sys.exit(1)
-
-    print("Dialogs (groups/channels have negative IDs):\n")
-    async for d in client.iter_dialogs():
-        name = (d.name or d.title or "?")
-        eid = get_peer_id(d.entity)
-        print(f"  {eid}\t{name}")
-    await client.disconnect()
+    finally:
+        await client.disconnect()
 
 
 if __name__ == "__main__":
@@ -7,6 +7,7 @@ Usage:
   uv run python login_local.py              # MCP session for Cursor IDE (.session-state)
   uv run python login_local.py --agent     # Agent session for agent_vibe (.session-state-agent)
   uv run python login_local.py --agent-mcp # MCP session for Cursor agent (.session-state-agent-mcp)
+  uv run python login_local.py --pool acc2 # Extra agent_vibe pool session (.session-state-pool-acc2)
 """
 import argparse
 import asyncio
@@ -22,9 +23,12 @@ PROJECT_DIR = Path(__file__).resolve().parent
 parser = argparse.ArgumentParser(description="Login to Telegram")
 parser.add_argument("--agent", action="store_true", help="Create session for agent_vibe (avoids MCP lock)")
 parser.add_argument("--agent-mcp", action="store_true", help="Create session for Cursor agent MCP (avoids IDE MCP lock)")
+parser.add_argument("--pool", metavar="NAME", help="Create extra session for agent_vibe's session pool (use with agent_vibe --pool NAME)")
 args = parser.parse_args()
 
-if args.agent_mcp:
+if args.pool:
+    SESSION_BASE = PROJECT_DIR / f".session-state-pool-{args.pool}"
+elif args.agent_mcp:
     SESSION_BASE = PROJECT_DIR / ".session-state-agent-mcp"
 elif args.agent:
     SESSION_BASE = PROJECT_DIR / ".session-state-agent"
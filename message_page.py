@@ -0,0 +1,76 @@
+"""
+Field projection and opaque page cursors for the paginated get_messages tool.
+
+project() builds one plain dict per message with only the requested fields, straight from
+the Telethon message (no pydantic model per message). Cursors are urlsafe base64 JSON,
+bound to the entity they were issued for.
+"""
+import base64
+import json
+from datetime import datetime
+
+from telethon import utils
+from telethon.tl import types
+
+from mcp_telegram.types import Media
+
+
+def _reply_to(m) -> int | None:
+    if isinstance(m.reply_to, types.MessageReplyHeader) and m.reply_to.reply_to_msg_id:
+        return int(m.reply_to.reply_to_msg_id)
+    return None
+
+
+def _media(m) -> dict | None:
+    info = Media.from_message(m) if m.media else None
+    return info.model_dump() if info else None
+
+
+# Same fields (and values) as mcp_telegram.types.Message
+_GETTERS = {
+    "message_id": lambda m: m.id,
+    "sender_id": lambda m: int(utils.get_peer_id(m.from_id)) if m.from_id else None,
+    "message": lambda m: m.text if isinstance(m.text, str) else None,
+    "outgoing": lambda m: bool(m.out),
+    "date": lambda m: m.date.isoformat() if m.date else None,
+    "media": _media,
+    "reply_to": _reply_to,
+}
+FIELDS = tuple(_GETTERS)
+ALIASES = {"id": "message_id", "sender": "sender_id", "text": "message"}
+
+
+def resolve_fields(fields: list[str] | None) -> list[tuple[str, str]]:
+    """[(output name, message field)] for a `fields` argument; all fields when None."""
+    if not fields:
+        return [(f, f) for f in FIELDS]
+    out = []
+    for name in fields:
+        field = ALIASES.get(name, name)
+        if field not in _GETTERS:
+            raise ValueError(f"Unknown field {name!r}. Choose from: {', '.join(FIELDS + tuple(ALIASES))}")
+        out.append((name, field))
+    return out
+
+
+def project(fields: list[tuple[str, str]]):
+    """Function turning a Telethon message into a dict of the resolve_fields() fields."""
+    getters = [(name, _GETTERS[field]) for name, field in fields]
+    return lambda m: {name: get(m) for name, get in getters}
+
+
+def encode_cursor(entity: str, offset_id: int, start_date: datetime | None) -> str:
+    data = {"e": entity, "o": offset_id, "s": start_date.isoformat() if start_date else None}
+    return base64.urlsafe_b64encode(json.dumps(data, separators=(",", ":")).encode()).decode()
+
+
+def decode_cursor(cursor: str, entity: str) -> tuple[int, datetime | None]:
+    """(offset_id, start_date) from a cursor issued for `entity`."""
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        offset_id, start = int(data["o"]), data["s"]
+    except Exception:
+        raise ValueError("Invalid cursor") from None
+    if data.get("e") != entity:
+        raise ValueError(f"Cursor was issued for entity {data.get('e')}, not {entity}")
+    return offset_id, datetime.fromisoformat(start) if start else None
@@ -9,4 +9,7 @@ exec uv run python agent_vibe.py -w /share/datasets/home/wendler/code \
   --dialog="$DOOM_GROUP_ID" \
   --chat-file=.vibe-agent-chat-doom \
   --queue=.vibe-send-queue-doom \
-  -i 1
+  --context-file=.vibe-context-doom.md \
+  -i 1 \
+  --metrics-port 9102 \
+  "$@"
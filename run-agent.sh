@@ -1,4 +1,5 @@
 #!/bin/bash
 # Run the Vibe agent. Use from screen: ./run-agent.sh
+# Redeploy without downtime: screen -dmS cursor-agent-new ./run-agent.sh --takeover
 cd "$(dirname "$0")"
-exec uv run python agent_vibe.py -w /share/datasets/home/wendler/code --dialog=-5150901335 -i 1
+exec uv run python agent_vibe.py -w /share/datasets/home/wendler/code --dialog=-5150901335 -i 1 --metrics-port 9101 "$@"
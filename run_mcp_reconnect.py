@@ -2,86 +2,596 @@
 """
 Run MCP Telegram server with reconnect-on-failure.
 Patches the server to reconnect when the Telegram connection drops during long agent runs.
+
+Metrics (optional): VIBE_METRICS_PORT=9111 serves http://127.0.0.1:9111/metrics;
+VIBE_METRICS_INTERVAL (default 300, 0 = off) prints a summary line to stderr.
+Stalls longer than VIBE_STALL_THRESHOLD (default 0.5s, 0 = off) are reported on stderr;
+`kill -USR1 <pid>` writes a 30s profile to .vibe-profiles/.
 """
 import asyncio
 import logging
+import os
 import sys
+from datetime import datetime, timezone
+from pathlib import Path
 
 # Apply before mcp_telegram imports
 logging.getLogger("telethon").setLevel(logging.WARNING)
 
+from pydantic import BaseModel
+from telethon.errors import MessageNotModifiedError
+from telethon.tl import patched
+
 from mcp_telegram.telegram import Telegram
 from mcp_telegram.server import mcp
 from mcp_telegram import server as server_module
+from mcp_telegram.types import Dialog, Message, Messages
+from mcp_telegram.utils import parse_entity, parse_telegram_url
+
+from message_page import decode_cursor, encode_cursor, project, resolve_fields
+from vibe_send import new_key, send_text
+
+from vibe_metrics import FLOODWAITS, RECONNECTS, RETRIES, TOOL, is_flood_wait, start_metrics_server, start_summary_thread
+from vibe_profiling import LoopStallDetector, install_profile_signal, register_routes
+
+PROFILE_DIR = Path(__file__).resolve().parent / ".vibe-profiles"
+STALL_THRESHOLD = float(os.environ.get("VIBE_STALL_THRESHOLD", "0.5"))
+BATCH_CONCURRENCY = 8  # Chats fetched in parallel by the batch tools
+
+
+class BatchMessages(BaseModel):
+    """Messages from one entity of a batch request, or the error for that entity."""
+
+    entity: str
+    """The entity as given in the request."""
+    messages: Messages | None = None
+    """The messages, if the fetch succeeded."""
+    error: str | None = None
+    """Why this entity failed, if it did."""
+
+
+class LinkMessage(BaseModel):
+    """The message behind one link of a batch request, or the error for that link."""
+
+    link: str
+    """The link as given in the request."""
+    message: Message | None = None
+    """The message, if it was found."""
+    error: str | None = None
+    """Why this link failed, if it did."""
+
+
+class MessageEdit(BaseModel):
+    """One edit of a batch edit request."""
+
+    entity: str
+    """The chat the message is in."""
+    message_id: int
+    """The message to edit."""
+    message: str
+    """The new text."""
+
+
+class BulkResult(BaseModel):
+    """The outcome for one item of a bulk read, delete or edit request."""
+
+    entity: str
+    """The entity as given in the request."""
+    message_id: int | None = None
+    """The edited message (edits only)."""
+    affected: int | None = None
+    """How many messages Telegram reported as deleted (deletes only)."""
+    error: str | None = None
+    """Why this item failed, if it did."""
+
+
+class MessagePage(BaseModel):
+    """One page of messages, projected to the requested fields."""
+
+    messages: list[dict]
+    """The messages, newest first, each holding only the requested fields."""
+    dialog: Dialog | None = None
+    """The dialog the messages belong to."""
+    next_cursor: str | None = None
+    """Pass as `cursor` to get the next (older) page; None when there are no more messages."""
 
 
 class ReconnectTelegram(Telegram):
     """Telegram wrapper that reconnects on connection failure."""
 
+    _stall_detector = None
+
     async def _ensure_connected(self):
+        if self._stall_detector is None and STALL_THRESHOLD:
+            # mcp.run() owns the loop, so attach to it on the first tool call
+            self._stall_detector = LoopStallDetector(asyncio.get_running_loop(), STALL_THRESHOLD).start()
         if self._client is None:
             return
         if not self._client.is_connected():
             await self._client.connect()
 
-    async def _with_reconnect(self, make_coro):
+    async def _with_reconnect(self, make_coro, tool: str = "other"):
         """Run coroutine, retry with reconnect on connection errors.
         make_coro must be a callable returning a coroutine (for retry to get fresh coro).
+        The whole call, retries included, is timed under mcp_tool_seconds{tool=...}.
         """
-        last_err = None
-        for attempt in range(2):
-            try:
+        with TOOL.time(tool=tool):
+            last_err = None
+            for attempt in range(2):
+                try:
+                    if attempt:
+                        RECONNECTS.inc()
+                    await self._ensure_connected()
+                    return await make_coro()
+                except Exception as e:
+                    last_err = e
+                    if is_flood_wait(e):
+                        FLOODWAITS.inc(op=tool)
+                    if self._is_connection_error(e):
+                        RETRIES.inc(op=tool)
+                        await self._drop_connection()
+                        continue
+                    raise
+            raise last_err
+
+    @staticmethod
+    def _is_connection_error(e: Exception) -> bool:
+        err_str = str(e).lower()
+        return any(x in err_str for x in ("connection", "disconnect", "not connected", "closed"))
+
+    async def _drop_connection(self):
+        try:
+            if self._client and self._client.is_connected():
+                await self._client.disconnect()
+        except Exception:
+            pass
+        await asyncio.sleep(1)
+
+    async def _fan_out(self, items: list, fn, tool: str, concurrency: int = BATCH_CONCURRENCY) -> list:
+        """Run fn(item) for every item, at most `concurrency` at a time, on one connection.
+
+        Returns (result, error) per item, in order. Items that failed with a connection
+        error are retried once after a reconnect; other errors are reported, not raised.
+        """
+        outcomes: dict[int, tuple] = {}
+        pending = list(range(len(items)))
+        sem = asyncio.Semaphore(concurrency)
+
+        async def one(i):
+            async with sem:
+                try:
+                    return i, await fn(items[i]), None
+                except Exception as e:
+                    if is_flood_wait(e):
+                        FLOODWAITS.inc(op=tool)
+                    return i, None, e
+
+        with TOOL.time(tool=tool):
+            for attempt in range(2):
+                if attempt:
+                    RECONNECTS.inc()
+                    RETRIES.inc(op=tool)
+                    await self._drop_connection()
                 await self._ensure_connected()
-                return await make_coro()
-            except Exception as e:
-                last_err = e
-                err_str = str(e).lower()
-                if any(x in err_str for x in ("connection", "disconnect", "not connected", "closed")):
-                    try:
-                        if self._client and self._client.is_connected():
-                            await self._client.disconnect()
-                    except Exception:
-                        pass
-                    await asyncio.sleep(1)
-                    continue
-                raise
-        raise last_err
+                retry = []
+                for i, result, err in await asyncio.gather(*(one(i) for i in pending)):
+                    if err is not None and not attempt and self._is_connection_error(err):
+                        retry.append(i)
+                    else:
+                        outcomes[i] = (result, err)
+                if not retry:
+                    break
+                pending = retry
+        return [outcomes[i] for i in range(len(items))]
 
-    async def send_message(self, entity, message="", file_path=None, reply_to=None):
-        await self._with_reconnect(
-            lambda: Telegram.send_message(self, entity, message, file_path=file_path, reply_to=reply_to)
-        )
+    async def get_messages_batch(self, entities, limit=10, unread=False):
+        async def fetch(entity):
+            return await Telegram.get_messages(self, parse_entity(entity), limit, unread=unread)
+
+        return [
+            BatchMessages(entity=e, messages=result, error=f"{type(err).__name__}: {err}" if err else None)
+            for e, (result, err) in zip(entities, await self._fan_out(entities, fetch, "get_messages_batch"))
+        ]
+
+    async def messages_from_links(self, links):
+        """Resolve links with one GetMessages request per chat (not per link)."""
+        by_chat: dict = {}
+        results: dict[str, LinkMessage] = {}
+        for link in links:
+            parsed = parse_telegram_url(link)
+            if parsed is None:
+                results[link] = LinkMessage(link=link, error="Not a Telegram message link")
+            else:
+                by_chat.setdefault(parsed[0], []).append((link, parsed[1]))
+
+        async def fetch_chat(chat):
+            ids = [msg_id for _, msg_id in by_chat[chat]]
+            return await self.client.get_messages(chat, ids=ids)  # Telethon sends ids in chunks of 100
+
+        chats = list(by_chat)
+        for chat, (found, err) in zip(chats, await self._fan_out(chats, fetch_chat, "messages_from_links")):
+            for (link, msg_id), message in zip(by_chat[chat], found or [None] * len(by_chat[chat])):
+                if err is not None:
+                    results[link] = LinkMessage(link=link, error=f"{type(err).__name__}: {err}")
+                elif not isinstance(message, patched.Message):
+                    results[link] = LinkMessage(link=link, error=f"Message {msg_id} not found in {chat}")
+                else:
+                    results[link] = LinkMessage(link=link, message=Message.from_message(message))
+        return [results[link] for link in links]
+
+    async def mark_read_batch(self, reads: dict[str, int | None]):
+        """One ReadHistory request per chat, acknowledging everything up to its max_id (None = all)."""
+        entities = list(reads)
+
+        async def ack(entity):
+            await self.client.send_read_acknowledge(parse_entity(entity), max_id=reads[entity] or 0)
+
+        return [
+            BulkResult(entity=e, error=f"{type(err).__name__}: {err}" if err else None)
+            for e, (_, err) in zip(entities, await self._fan_out(entities, ack, "mark_read_batch"))
+        ]
+
+    async def delete_messages_batch(self, deletes: dict[str, list[int]]):
+        entities = list(deletes)
+
+        async def delete(entity):
+            # Telethon sends the ids in chunks of 100, pipelined; deleting twice is harmless on retry
+            affected = await self.client.delete_messages(parse_entity(entity), deletes[entity])
+            return sum(a.pts_count for a in affected)
+
+        return [
+            BulkResult(entity=e, affected=count, error=f"{type(err).__name__}: {err}" if err else None)
+            for e, (count, err) in zip(entities, await self._fan_out(entities, delete, "delete_messages_batch"))
+        ]
+
+    async def edit_messages_batch(self, edits: list[MessageEdit]):
+        async def edit(item):
+            try:
+                await self.client.edit_message(parse_entity(item.entity), item.message_id, item.message)
+            except MessageNotModifiedError:
+                pass  # Already has this text, e.g. applied by an attempt whose reply was lost
+
+        return [
+            BulkResult(entity=e.entity, message_id=e.message_id, error=f"{type(err).__name__}: {err}" if err else None)
+            for e, (_, err) in zip(edits, await self._fan_out(edits, edit, "edit_messages_batch"))
+        ]
+
+    async def send_message(self, entity, message="", file_path=None, reply_to=None, key=None):
+        if file_path:
+            # Telethon builds media requests (and their random_ids) itself, so these aren't deduplicated
+            await self._with_reconnect(
+                lambda: Telegram.send_message(self, entity, message, file_path=file_path, reply_to=reply_to),
+                tool="send_message",
+            )
+            return
+        key = key or new_key()  # Fixed before the first attempt: a retry after a lost reply can't post twice
+        await self._with_reconnect(lambda: send_text(self.client, entity, message, key, reply_to), tool="send_message")
 
     async def edit_message(self, entity, message_id, message):
-        await self._with_reconnect(lambda: Telegram.edit_message(self, entity, message_id, message))
+        await self._with_reconnect(lambda: Telegram.edit_message(self, entity, message_id, message), tool="edit_message")
 
     async def delete_message(self, entity, message_ids):
-        await self._with_reconnect(lambda: Telegram.delete_message(self, entity, message_ids))
+        await self._with_reconnect(lambda: Telegram.delete_message(self, entity, message_ids), tool="delete_message")
 
     async def search_dialogs(self, query, limit=10, global_search=False):
-        return await self._with_reconnect(lambda: Telegram.search_dialogs(self, query, limit, global_search))
+        return await self._with_reconnect(lambda: Telegram.search_dialogs(self, query, limit, global_search), tool="search_dialogs")
 
     async def get_draft(self, entity):
-        return await self._with_reconnect(lambda: Telegram.get_draft(self, entity))
+        return await self._with_reconnect(lambda: Telegram.get_draft(self, entity), tool="get_draft")
 
     async def set_draft(self, entity, message):
-        await self._with_reconnect(lambda: Telegram.set_draft(self, entity, message))
+        await self._with_reconnect(lambda: Telegram.set_draft(self, entity, message), tool="set_draft")
 
     async def get_messages(self, entity, limit=10, start_date=None, end_date=None, unread=False, mark_as_read=False):
-        return await self._with_reconnect(
-            lambda: Telegram.get_messages(self, entity, limit, start_date, end_date, unread, mark_as_read)
+        result = await self._with_reconnect(
+            lambda: Telegram.get_messages(self, entity, limit, start_date, end_date, unread),
+            tool="get_messages",
         )
+        if mark_as_read and result.messages:
+            # Upstream acknowledges each message separately; one ack up to the newest covers them all
+            max_id = max(m.message_id for m in result.messages)
+            try:
+                await self._with_reconnect(
+                    lambda: self.client.send_read_acknowledge(entity, max_id=max_id), tool="mark_read"
+                )
+            except Exception as e:
+                print(f"Failed to mark messages in {entity} as read: {e}", file=sys.stderr)
+        return result
+
+    async def get_messages_page(self, entity, limit=10, start_date=None, end_date=None, fields=None, cursor=None):
+        """Like get_messages, but builds plain dicts of `fields` only and returns a cursor."""
+        to_dict = project(resolve_fields(fields))
+        key = str(entity)
+        offset_id = 0
+        if cursor:
+            offset_id, start_date = decode_cursor(cursor, key)
+        if start_date is not None and start_date.tzinfo is None:
+            start_date = start_date.replace(tzinfo=timezone.utc)
+
+        async def fetch():
+            _entity = await self.client.get_entity(entity)
+            messages, last_id, more = [], 0, False
+            async for m in self.client.iter_messages(_entity, offset_id=offset_id, offset_date=None if offset_id else end_date):
+                if not isinstance(m, patched.Message) or isinstance(m, patched.MessageService | patched.MessageEmpty):
+                    continue
+                if m.date is None:
+                    continue
+                if start_date is not None and m.date < start_date:
+                    break
+                if len(messages) >= limit:
+                    more = True
+                    break
+                messages.append(to_dict(m))
+                last_id = m.id
+            return MessagePage(
+                messages=messages,
+                dialog=Dialog.from_entity(_entity),
+                next_cursor=encode_cursor(key, last_id, start_date) if more else None,
+            )
+
+        return await self._with_reconnect(fetch, tool="get_messages")
 
     async def download_media(self, entity, message_id, path=None):
-        return await self._with_reconnect(lambda: Telegram.download_media(self, entity, message_id, path))
+        return await self._with_reconnect(lambda: Telegram.download_media(self, entity, message_id, path), tool="download_media")
 
     async def message_from_link(self, link):
-        return await self._with_reconnect(lambda: Telegram.message_from_link(self, link))
+        return await self._with_reconnect(lambda: Telegram.message_from_link(self, link), tool="message_from_link")
 
 
 # Replace tg with reconnect wrapper
 server_module.tg = ReconnectTelegram()
 
+
+mcp.remove_tool("send_message")
+
+
+@mcp.tool()
+async def send_message(
+    entity: str,
+    message: str = "",
+    file_path: list[str] | None = None,
+    reply_to: int | None = None,
+    idempotency_key: str | None = None,
+) -> str:
+    """Send a message to a Telegram user, group, or channel.
+
+    It allows sending text messages to any Telegram entity identified by `entity`.
+    Text messages are sent at most once, even when the connection drops and the
+    send is retried.
+
+    !IMPORTANT: If you are not sure about the entity, use the `search_dialogs`
+    tool and ask the user to select the correct entity from the list.
+
+    Args:
+        entity (`str`): The identifier of where to send the message.
+            This can be a Telegram chat ID, a username, a phone number
+            (in format '+1234567890'), or a group/channel username. The special
+            value "me" can be used to send a message to yourself.
+
+        message (`str`, optional): The text message to be sent.
+            The message supports Markdown formatting including **bold**, __italic__,
+            `monospace`, and [URL](links). The maximum length for a message is 35,000
+            bytes or 4,096 characters.
+
+        file_path (`list[str]`, optional): The list of paths to the files to be sent.
+
+        reply_to (`int`, optional): The message ID to reply to.
+
+        idempotency_key (`str`, optional): A key unique to this message. If you
+            call `send_message` again after a timeout, pass the same key: a message
+            that already went through is not posted twice. Ignored for files.
+
+    Returns:
+        `str`:
+            A success message if sent, or an error message if failed.
+    """
+
+    _entity = parse_entity(entity)
+
+    await server_module.tg.send_message(
+        _entity,
+        message,
+        file_path=file_path,
+        reply_to=reply_to,
+        key=idempotency_key,
+    )
+
+    return f"Message sent to {entity}"
+
+
+@mcp.tool()
+async def get_messages_batch(entities: list[str], limit: int = 10, unread: bool = False) -> list[BatchMessages]:
+    """Get messages from several entities in one call.
+
+    Fetches all entities concurrently over one connection, so checking many chats
+    costs about as much as the slowest one. Use this instead of calling `get_messages`
+    once per chat.
+
+    Args:
+        entities (`list[str]`):
+            The identifiers of the entities to get messages from (chat IDs,
+            usernames, phone numbers, or 'me').
+
+        limit (`int`, optional):
+            The maximum number of messages to retrieve per entity.
+            Defaults to 10.
+
+        unread (`bool`, optional):
+            Whether to get only unread messages.
+            Defaults to False.
+
+    Returns:
+        `list[BatchMessages]`:
+            One entry per entity, in request order, with either its messages or
+            the error for that entity. One failing entity does not fail the call.
+    """
+
+    return await server_module.tg.get_messages_batch(entities, limit, unread)
+
+
+@mcp.tool()
+async def messages_from_links(links: list[str]) -> list[LinkMessage]:
+    """Get the messages behind several links in one call.
+
+    Links to the same chat are resolved with a single request; chats are
+    fetched concurrently. Use this instead of calling `message_from_link`
+    once per link.
+
+    Args:
+        links (`list[str]`): The message links (e.g. `https://t.me/username/123`,
+            `https://t.me/c/1234567890/123`).
+
+    Returns:
+        `list[LinkMessage]`:
+            One entry per link, in request order, with either the message or the
+            error for that link. One failing link does not fail the call.
+    """
+
+    return await server_module.tg.messages_from_links(links)
+
+
+@mcp.tool()
+async def mark_read_batch(reads: dict[str, int | None]) -> list[BulkResult]:
+    """Mark several entities as read in one call.
+
+    Each chat takes a single request that acknowledges all its messages up to
+    a message ID, no matter how many are unread. Chats are handled concurrently.
+
+    Args:
+        reads (`dict[str, int | None]`):
+            By entity identifier (chat ID, username, phone number, or 'me'):
+            the message ID up to and including which to mark messages as read
+            (IDs are numbered per chat), or null for all messages.
+
+    Returns:
+        `list[BulkResult]`:
+            One entry per entity, in request order, with the error for that
+            entity if it failed. One failing entity does not fail the call.
+    """
+
+    return await server_module.tg.mark_read_batch(reads)
+
+
+@mcp.tool()
+async def delete_messages_batch(deletes: dict[str, list[int]]) -> list[BulkResult]:
+    """Delete many messages from several entities in one call.
+
+    The IDs of each chat are deleted in requests of up to 100; chats are
+    handled concurrently. Use this instead of calling `delete_message` once
+    per chat or per message.
+
+    Args:
+        deletes (`dict[str, list[int]]`):
+            The message IDs to delete, by entity identifier (chat ID,
+            username, phone number, or 'me').
+
+    Returns:
+        `list[BulkResult]`:
+            One entry per entity, in request order, with the number of messages
+            deleted (`affected`) or the error for that entity. One failing
+            entity does not fail the call.
+    """
+
+    return await server_module.tg.delete_messages_batch(deletes)
+
+
+@mcp.tool()
+async def edit_messages_batch(edits: list[MessageEdit]) -> list[BulkResult]:
+    """Edit several messages, in one or more entities, in one call.
+
+    Edits run concurrently (8 at a time) over one connection. An edit that
+    leaves the text unchanged counts as done.
+
+    Args:
+        edits (`list[MessageEdit]`):
+            The edits: `entity`, `message_id` and the new `message` text each.
+
+    Returns:
+        `list[BulkResult]`:
+            One entry per edit, in request order, with the error for that edit
+            if it failed. One failing edit does not fail the call.
+    """
+
+    return await server_module.tg.edit_messages_batch(edits)
+
+
+mcp.remove_tool("get_messages")
+
+
+@mcp.tool()
+async def get_messages(
+    entity: str,
+    limit: int = 10,
+    start_date: datetime | None = None,
+    end_date: datetime | None = None,
+    unread: bool = False,
+    mark_as_read: bool = False,
+    fields: list[str] | None = None,
+    cursor: str | None = None,
+) -> MessagePage:
+    """Get messages from a specific entity, one page at a time.
+
+    Retrieves messages from an entity specified by username, chat_id,
+    phone number, or 'me'. For long histories, keep `limit` small and follow
+    `next_cursor`; ask only for the `fields` you need.
+
+    !IMPORTANT: If the entity is not found, it will return an error message.
+    If you are not sure about the entity, use the `search_dialogs`
+    tool and ask the user to select the correct entity from the list.
+
+    Args:
+        entity (`str`):
+            The identifier of the entity to get messages from.
+            This can be a Telegram chat ID, a username, a phone number, or 'me'.
+
+        limit (`int`, optional):
+            The maximum number of messages to retrieve.
+            Defaults to 10.
+
+        start_date (`datetime`, optional):
+            The start date of the messages to retrieve.
+
+        end_date (`datetime`, optional):
+            The end date of the messages to retrieve.
+
+        unread (`bool`, optional):
+            Whether to get only unread messages.
+            Defaults to False.
+
+        mark_as_read (`bool`, optional):
+            Whether to mark the messages as read.
+            Defaults to False.
+
+        fields (`list[str]`, optional):
+            The message fields to return: message_id (or id), sender_id (or sender),
+            message (or text), outgoing, date, media, reply_to. Defaults to all.
+
+        cursor (`str`, optional):
+            The `next_cursor` of the previous page, to continue with older
+            messages. Not available with `unread` or `mark_as_read`.
+
+    Returns:
+        `MessagePage`:
+            The messages (newest first), the dialog they belong to and the
+            cursor for the next page if successful, or an error message if
+            request failed.
+    """
+
+    _entity = parse_entity(entity)
+
+    if unread or mark_as_read:
+        if cursor:
+            raise ValueError("cursor can't be combined with unread or mark_as_read")
+        projection = resolve_fields(fields)
+        result = await server_module.tg.get_messages(_entity, limit, start_date, end_date, unread, mark_as_read)
+        messages = [m.model_dump(mode="json") for m in result.messages]
+        return MessagePage(
+            messages=[{name: m[field] for name, field in projection} for m in messages],
+            dialog=result.dialog,
+        )
+    return await server_module.tg.get_messages_page(_entity, limit, start_date, end_date, fields, cursor)
+
+
 # Use lazy connect: don't connect on startup (takes 3+ sec, agent may timeout).
 # Connect on first tool call via _ensure_connected.
 async def lazy_lifespan(server):
@@ -98,4 +608,12 @@ async def lazy_lifespan(server):
 server_module.app_lifespan = lazy_lifespan
 
 if __name__ == "__main__":
+    # stdout carries the MCP protocol — metrics go to the HTTP endpoint and stderr only
+    install_profile_signal(PROFILE_DIR)
+    if os.environ.get("VIBE_METRICS_PORT"):
+        register_routes()
+        start_metrics_server(int(os.environ["VIBE_METRICS_PORT"]))
+    summary_interval = int(os.environ.get("VIBE_METRICS_INTERVAL", "300"))
+    if summary_interval:
+        start_summary_thread(summary_interval)
     mcp.run()
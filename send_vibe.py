@@ -11,22 +11,31 @@ os.environ["XDG_STATE_HOME"] = str(PROJECT_DIR / ".session-state")
 from dotenv import load_dotenv
 load_dotenv(PROJECT_DIR / ".env")
 
+from telethon.errors import UnauthorizedError
+
 from mcp_telegram.telegram import Telegram
 
+from vibe_io import create_client
+
 
 async def main():
     msg = sys.argv[1] if len(sys.argv) > 1 else "No message"
     tg = Telegram()
-    tg.create_client(
+    # Read-only snapshot of the session: works while the MCP server uses it
+    create_client(
+        tg,
         api_id=os.environ.get("TELEGRAM_API_ID") or os.environ.get("API_ID"),
         api_hash=os.environ.get("TELEGRAM_API_HASH") or os.environ.get("API_HASH"),
+        snapshot=True,
     )
     await tg.client.connect()
-    if not await tg.client.is_user_authorized():
+    try:
+        await tg.send_message(-5150901335, msg)
+    except UnauthorizedError:
         print("Not logged in. Run: uv run python login_local.py", file=sys.stderr)
         sys.exit(1)
-    await tg.send_message(-5150901335, msg)
-    await tg.client.disconnect()
+    finally:
+        await tg.client.disconnect()
     print("Sent.")
 
 
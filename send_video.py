@@ -5,8 +5,7 @@ Usage:
   uv run python send_video.py <file_path> [message]
   uv run python send_video.py /path/to/video.mp4 "[bot] Pong2p control video"
 
-Note: If you get "database is locked", the MCP/agent may be holding the session.
-      Stop the agent, run this script, then restart the agent.
+Uses a read-only snapshot of the session, so it works while the MCP server or agent is running.
 
 Extend this script or the MCP send_message tool for more file-sending use cases.
 """
@@ -21,8 +20,12 @@ os.environ["XDG_STATE_HOME"] = str(PROJECT_DIR / ".session-state")
 from dotenv import load_dotenv
 load_dotenv(PROJECT_DIR / ".env")
 
+from telethon.errors import UnauthorizedError
+
 from mcp_telegram.telegram import Telegram
 
+from vibe_io import create_client
+
 VIBE_ENTITY = "-5150901335"
 
 
@@ -42,21 +45,24 @@ async def main():
         sys.exit(1)
 
     tg = Telegram()
-    tg.create_client(
+    create_client(
+        tg,
         api_id=os.environ.get("TELEGRAM_API_ID") or os.environ.get("API_ID"),
         api_hash=os.environ.get("TELEGRAM_API_HASH") or os.environ.get("API_HASH"),
+        snapshot=True,
     )
     await tg.client.connect()
-    if not await tg.client.is_user_authorized():
+    try:
+        await tg.send_message(
+            VIBE_ENTITY,
+            message,
+            file_path=[str(file_path)],
+        )
+    except UnauthorizedError:
         print("Not logged in. Run: uv run python login_local.py", file=sys.stderr)
         sys.exit(1)
-
-    await tg.send_message(
-        VIBE_ENTITY,
-        message,
-        file_path=[str(file_path)],
-    )
-    await tg.client.disconnect()
+    finally:
+        await tg.client.disconnect()
     print(f"Sent: {file_path}")
 
 
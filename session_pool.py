@@ -0,0 +1,174 @@
+"""
+Pool of authorized Telegram sessions (one per account or session dir) for agent_vibe.
+
+Each session has a token-bucket rate budget and health state. Sends go to the least-loaded
+eligible session; a session that gets FloodWait is parked for the wait Telegram asked for and
+the send fails over to the next one. Reads (fetches, downloads) always use the primary (first)
+session: in a basic group every account numbers the messages itself, so message ids from
+different sessions can't be compared or looked up on another one. Pooled clients don't sleep out
+FloodWaits themselves (flood_sleep_threshold=0), so every one reaches the pool. Other errors on
+a send back the session off exponentially for sends (when there is another session to use) and
+are raised as usual — they are not retried elsewhere, since a send may already have gone
+through. Reads are never backed off: they have no other session to go to.
+
+Create extra sessions with `uv run python login_local.py --pool NAME` (any account that is a
+member of the group), then run agent_vibe with `--pool NAME` (repeatable).
+"""
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+from mcp_telegram.telegram import Telegram
+
+from vibe_io import create_client
+from vibe_metrics import FLOODWAITS, REGISTRY, is_flood_wait, timed
+
+SESSION_OPS = REGISTRY.counter("vibe_session_ops_total", "Operations per pooled session", ("session", "result"))
+MAX_BACKOFF = 300  # seconds a failing session is skipped at most
+
+
+class RateBudget:
+    """Token bucket: `rate` operations per second on average, bursts of up to `burst`."""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def wait_time(self) -> float:
+        """Seconds until a token is available (0 if one is available now)."""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    async def acquire(self) -> None:
+        while (wait := self.wait_time()) > 0:
+            await asyncio.sleep(wait)
+        self.tokens -= 1
+
+
+class SessionTelegram(Telegram):
+    """Telegram wrapper bound to an explicit state dir instead of $XDG_STATE_HOME."""
+
+    def __init__(self, state_home: Path):
+        self._state_dir = state_home / "mcp-telegram"
+        self._state_dir.mkdir(parents=True, exist_ok=True)
+        self._session_file = self._state_dir / "session"
+        self._downloads_dir = self._state_dir / "downloads"
+        self._downloads_dir.mkdir(parents=True, exist_ok=True)
+        self._client = None
+
+
+class PooledSession:
+    """One session of the pool plus its budget and health."""
+
+    def __init__(self, name: str, tg: Telegram, budget: RateBudget):
+        self.name = name
+        self.tg = tg
+        self.budget = budget
+        self.lock = asyncio.Lock()  # One connect → op → disconnect at a time per session file
+        self.in_flight = 0
+        self.blocked_until = 0.0  # FloodWait: no ops at all until then
+        self.backoff_until = 0.0  # Failed sends: no sends until then
+        self.failures = 0
+        self.ops = 0
+
+    def available_at(self, primary: bool = False) -> float:
+        return self.blocked_until if primary else max(self.blocked_until, self.backoff_until)
+
+    def eligible(self, now: float, primary: bool = False) -> bool:
+        return now >= self.available_at(primary)
+
+    def status(self) -> str:
+        blocked = self.available_at() - time.monotonic()
+        state = f"blocked {blocked:.0f}s" if blocked > 0 else "ok"
+        return f"{self.name}: {state}, {self.ops} ops, {self.in_flight} in flight"
+
+
+class AllSessionsBlocked(RuntimeError):
+    pass
+
+
+class SessionPool:
+    """Route Telegram operations across several sessions."""
+
+    def __init__(self, sessions: list[PooledSession], max_wait: float = 300):
+        if not sessions:
+            raise ValueError("SessionPool needs at least one session")
+        self.sessions = sessions
+        self.max_wait = max_wait
+
+    @classmethod
+    def from_state_dirs(
+        cls, state_dirs: list[Path], api_id: str | None, api_hash: str | None, rate: float = 3.0, burst: float = 10,
+    ) -> "SessionPool":
+        sessions = []
+        for d in state_dirs:
+            tg = SessionTelegram(d)
+            # FloodWaits reach run() instead of being slept out inside Telethon while holding this
+            # session's lock, so sends can move to another session
+            create_client(tg, api_id, api_hash).flood_sleep_threshold = 0
+            sessions.append(PooledSession(d.name, tg, RateBudget(rate, burst)))
+        return cls(sessions)
+
+    def candidates(self, primary: bool = False) -> list[PooledSession]:
+        return self.sessions[:1] if primary else self.sessions
+
+    def pick(self, primary: bool = False) -> PooledSession | None:
+        """Least-loaded eligible session (the primary one if `primary`), or None if all are blocked."""
+        now = time.monotonic()
+        eligible = [s for s in self.candidates(primary) if s.eligible(now, primary)]
+        if not eligible:
+            return None
+        return min(eligible, key=lambda s: (s.in_flight, s.budget.wait_time(), s.ops))
+
+    async def run(self, op: str, fn, primary: bool = False):
+        """await fn(session) on the best session; fail over to another one on FloodWait.
+        With `primary`, only the primary session is used (and waited for on FloodWait).
+        """
+        while True:
+            session = self.pick(primary)
+            if session is None:
+                candidates = self.candidates(primary)
+                wait = min(s.available_at(primary) for s in candidates) - time.monotonic()
+                if wait > self.max_wait:
+                    raise AllSessionsBlocked(f"All {len(candidates)} sessions flood-limited for {wait:.0f}s+")
+                await asyncio.sleep(max(wait, 0))
+                continue
+            session.in_flight += 1
+            try:
+                await session.budget.acquire()
+                with timed("lock_wait"):
+                    await session.lock.acquire()
+                try:
+                    result = await fn(session)
+                finally:
+                    session.lock.release()
+            except Exception as e:
+                if is_flood_wait(e):
+                    seconds = getattr(e, "seconds", 60)
+                    session.blocked_until = time.monotonic() + seconds
+                    FLOODWAITS.inc(op=op)
+                    SESSION_OPS.inc(session=session.name, result="flood")
+                    print(f"{session.name}: FloodWait {seconds}s on {op}, {'waiting' if primary else 'failing over'}", file=sys.stderr)
+                    continue
+                if not primary:  # Reads have nowhere else to go: don't stall them
+                    session.failures += 1
+                    if len(self.sessions) > 1:
+                        session.backoff_until = time.monotonic() + min(MAX_BACKOFF, 2 ** session.failures)
+                SESSION_OPS.inc(session=session.name, result="error")
+                raise
+            else:
+                if not primary:
+                    session.failures = 0
+                session.ops += 1
+                SESSION_OPS.inc(session=session.name, result="ok")
+                return result
+            finally:
+                session.in_flight -= 1
+
+    def status(self) -> str:
+        return "; ".join(s.status() for s in self.sessions)
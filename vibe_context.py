@@ -0,0 +1,115 @@
+"""
+Conversation context handed to each agent run.
+
+agent_vibe feeds every fetched message and every finished task into a ConversationContext;
+before a run it is rendered to a small Markdown file in the workspace (written atomically),
+and the prompt points the agent at it. The agent gets recent history without calling
+get_messages.
+
+Usage:
+  context = ConversationContext()
+  context.add_messages(result.messages)
+  context.add_outcome("1234", "fix the build", 0, task_log.tail(600))
+  await context.write(workspace / ".vibe-context.md")
+"""
+import os
+from collections import deque
+from pathlib import Path
+
+from vibe_io import run_io
+
+
+class ConversationContext:
+    """Recent dialog messages and task outcomes, rendered to at most max_bytes."""
+
+    def __init__(
+        self,
+        max_messages: int = 60,
+        max_outcomes: int = 10,
+        max_text: int = 800,
+        max_bytes: int = 24 * 1024,
+    ):
+        self.max_messages = max_messages
+        self.max_text = max_text
+        self.max_bytes = max_bytes
+        self._messages: dict[int, tuple[str, str, str]] = {}  # id → (date, who, text)
+        self._outcomes: deque[dict] = deque(maxlen=max_outcomes)
+        self._rendered: str | None = None
+
+    def add_messages(self, messages) -> None:
+        """Add mcp_telegram Messages (any order; known ids are updated, e.g. after an edit)."""
+        for m in messages:
+            text = (m.message or "").strip()
+            if m.media is not None:
+                text = f"[attachment: {m.media.file_name or m.media.mime_type or 'media'}] {text}".strip()
+            if not text:
+                continue
+            who = "me" if m.outgoing else str(m.sender_id)
+            entry = (m.date.strftime("%Y-%m-%d %H:%M"), who, self._clip(text))
+            if self._messages.get(m.message_id) != entry:
+                self._messages[m.message_id] = entry
+                self._rendered = None
+        if len(self._messages) > self.max_messages:
+            for message_id in sorted(self._messages)[: len(self._messages) - self.max_messages]:
+                del self._messages[message_id]
+
+    def add_outcome(self, task_id: str, instruction: str, code: int, output_tail: str = "") -> None:
+        self._outcomes.append({
+            "task_id": task_id,
+            "instruction": self._clip(instruction),
+            "code": code,
+            "tail": output_tail[-self.max_text:],
+        })
+        self._rendered = None
+
+    def render(self) -> str:
+        """Markdown digest; the oldest messages are dropped first to stay under max_bytes."""
+        if self._rendered is not None:
+            return self._rendered
+        outcomes = ["## Previous tasks (oldest first)", ""]
+        for o in self._outcomes:
+            status = "done" if o["code"] == 0 else f"failed (exit {o['code']})"
+            outcomes.append(f"- Task {o['task_id']}: {status}. Instruction: {o['instruction']}")
+            if o["tail"].strip():
+                outcomes.append("  Output tail:\n  " + o["tail"].strip().replace("\n", "\n  "))
+        messages = [
+            f"- #{message_id} {date} {who}: {text}"
+            for message_id, (date, who, text) in sorted(self._messages.items())
+        ]
+        header = ["# Conversation context", "", "## Recent messages (oldest first; `me` = this account)", ""]
+        budget = self.max_bytes - len("\n".join(header + outcomes).encode()) - 2
+        kept: list[str] = []
+        for line in reversed(messages):
+            budget -= len(line.encode()) + 1
+            if budget < 0:
+                break
+            kept.append(line)
+        self._rendered = "\n".join(header + kept[::-1] + [""] + outcomes) + "\n"
+        return self._rendered
+
+    async def write(self, path: Path) -> None:
+        """Write render() to path atomically (readers never see a partial file)."""
+        data = self.render()
+
+        def write_sync():
+            tmp = path.with_name(path.name + ".tmp")
+            tmp.write_text(data)
+            os.replace(tmp, path)
+
+        await run_io(write_sync)
+
+    def state(self) -> dict:
+        """JSON-serializable state, for handing over to another process."""
+        return {
+            "messages": [[message_id, *entry] for message_id, entry in self._messages.items()],
+            "outcomes": list(self._outcomes),
+        }
+
+    def load_state(self, state: dict) -> None:
+        self._messages.update({message_id: tuple(entry) for message_id, *entry in state["messages"]})
+        self._outcomes.extend(state["outcomes"])
+        self._rendered = None
+
+    def _clip(self, text: str) -> str:
+        text = " ".join(text.split())  # One line per entry
+        return text if len(text) <= self.max_text else text[: self.max_text - 1] + "…"
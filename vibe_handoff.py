@@ -0,0 +1,229 @@
+"""
+Zero-downtime restarts for agent_vibe.
+
+A running agent_vibe listens on a Unix control socket (.vibe-control-<dialog>.sock). A new
+instance started with --takeover connects to it: the old process stops ingesting, waits out
+in-flight Telegram operations and sends its state (queue, watermark, running agent) together
+with the agent's output pipe, then exits. The new process adopts the agent and keeps following
+its output — whatever the old process hadn't read yet is still in the pipe.
+
+The agent runs under `sh`, which writes its exit code to a file: after a handoff the new
+process is not the agent's parent and can't wait() for it.
+
+Usage:
+  agent = await AgentProcess.spawn(cmd, cwd, env, exit_file)
+  await agent.follow(on_chunk)          # raises HandedOff after agent.detach()
+  code = await agent.wait()
+"""
+import asyncio
+import json
+import os
+import signal
+import socket
+import struct
+import subprocess
+import sys
+from pathlib import Path
+
+from vibe_io import read_text, run_io
+
+_EXIT_WRAPPER = '"$@"; code=$?; echo $code > "$VIBE_EXIT_FILE.tmp" && mv "$VIBE_EXIT_FILE.tmp" "$VIBE_EXIT_FILE"'
+_HIGH_WATER = 64  # Chunks buffered before reading from the pipe pauses
+_DETACH = object()
+_MAX_STATE = 64 * 1024 * 1024
+
+
+class HandedOff(Exception):
+    """The agent was handed to another process; stop following it here."""
+
+
+class _PipeProtocol(asyncio.Protocol):
+    def __init__(self):
+        self.chunks: asyncio.Queue = asyncio.Queue()
+        self.transport = None
+        self.paused = False
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def data_received(self, data):
+        self.chunks.put_nowait(data)
+        if self.chunks.qsize() >= _HIGH_WATER and not self.paused:
+            self.transport.pause_reading()
+            self.paused = True
+
+    def connection_lost(self, exc):
+        self.chunks.put_nowait(None)
+
+
+class AgentProcess:
+    """A running agent: its pid, the read end of its stdout+stderr pipe and its exit file."""
+
+    def __init__(self, pid: int, fd: int, exit_file: Path, popen: subprocess.Popen | None = None):
+        self.pid = pid
+        self.fd = fd
+        self.exit_file = exit_file
+        self.popen = popen  # None when adopted from another process
+        self.eof = False
+        self._proto: _PipeProtocol | None = None
+        self._reading = asyncio.Event()
+        self._stopped = asyncio.Event()
+
+    @classmethod
+    async def spawn(cls, cmd: list[str], cwd: Path, env: dict, exit_file: Path) -> "AgentProcess":
+        """Start cmd in its own session (so it outlives us) with stdout and stderr on a pipe."""
+        def prepare():
+            exit_file.parent.mkdir(parents=True, exist_ok=True)  # The wrapper can't write it otherwise
+            exit_file.unlink(missing_ok=True)
+
+        await run_io(prepare)
+        r, w = os.pipe()
+        try:
+            popen = await run_io(lambda: subprocess.Popen(
+                ["sh", "-c", _EXIT_WRAPPER, "sh", *cmd],
+                stdin=subprocess.DEVNULL,
+                stdout=w,
+                stderr=w,
+                cwd=cwd,
+                env={**env, "VIBE_EXIT_FILE": str(exit_file)},
+                start_new_session=True,
+            ))
+        except BaseException:
+            os.close(r)
+            raise
+        finally:
+            os.close(w)
+        return cls(popen.pid, r, exit_file, popen)
+
+    async def follow(self, on_chunk) -> None:
+        """await on_chunk(data) for all output until EOF. Raises HandedOff after detach()."""
+        loop = asyncio.get_running_loop()
+        _, self._proto = await loop.connect_read_pipe(_PipeProtocol, os.fdopen(self.fd, "rb", buffering=0))
+        self._reading.set()
+        try:
+            while True:
+                chunk = await self._proto.chunks.get()
+                if chunk is None:
+                    self.eof = True
+                    return
+                if chunk is _DETACH:
+                    self._proto.transport.close()
+                    raise HandedOff
+                if self._proto.paused and self._proto.chunks.qsize() < _HIGH_WATER // 2:
+                    self._proto.paused = False
+                    self._proto.transport.resume_reading()
+                await on_chunk(chunk)
+        finally:
+            self._stopped.set()
+
+    async def detach(self) -> int | None:
+        """Stop following and return a duplicate of the pipe fd, with all unread output still in it.
+
+        Returns None if the agent reached EOF first (it finished; nothing to hand off).
+        """
+        await self._reading.wait()
+        if self.eof:
+            return None
+        fd = os.dup(self.fd)
+        self._proto.transport.pause_reading()
+        self._proto.chunks.put_nowait(_DETACH)  # Everything queued before it still goes to on_chunk
+        await self._stopped.wait()
+        if self.eof:
+            os.close(fd)
+            return None
+        return fd
+
+    async def wait(self) -> int:
+        """Exit code, once follow() has returned (-1 if the wrapper was killed before writing it)."""
+        if self.popen is not None:
+            await run_io(self.popen.wait)
+        for _ in range(20):  # The file is written before the pipe closes; allow for a slow share
+            text = (await read_text(self.exit_file)).strip()
+            if text:
+                await run_io(lambda: self.exit_file.unlink(missing_ok=True))
+                return int(text)
+            await asyncio.sleep(0.1)
+        return -1
+
+    def kill(self) -> None:
+        try:
+            os.killpg(self.pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+
+
+def control_socket_path(project_dir: Path, dialog: str) -> Path:
+    return project_dir / f".vibe-control-{dialog.lstrip('-')}.sock"
+
+
+def is_running(path: Path) -> bool:
+    """True if an agent_vibe is listening on the control socket."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(str(path))
+        except OSError:
+            return False
+    return True
+
+
+async def serve_control(path: Path, handoff, resume) -> None:
+    """Serve takeover requests on path until one succeeds.
+
+    `await handoff()` stops this process and returns (state, fds) for the new one; if the new
+    process doesn't acknowledge them, `await resume(state, fds)` carries on here instead.
+    """
+    loop = asyncio.get_running_loop()
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    path.unlink(missing_ok=True)  # A previous instance's socket; it has handed off or died
+    sock.bind(str(path))
+    sock.listen(1)
+    sock.setblocking(False)
+    try:
+        while True:
+            conn, _ = await loop.sock_accept(sock)
+            with conn:
+                if (await loop.sock_recv(conn, 64)).strip() != b"takeover":
+                    continue
+                state, fds = await handoff()
+                data = json.dumps(state).encode()
+                conn.setblocking(True)
+                conn.settimeout(60)
+                try:
+                    # sendmsg may send only part of a large buffer: the fds go with the header
+                    await run_io(socket.send_fds, conn, [struct.pack("!I", len(data))], fds)
+                    await run_io(conn.sendall, data)
+                    if await run_io(conn.recv, 16) == b"ok":
+                        return
+                    raise ConnectionError("no acknowledgement")
+                except OSError as e:
+                    print(f"Handoff failed ({e}), continuing here", file=sys.stderr)
+                    await resume(state, fds)
+    finally:
+        sock.close()
+
+
+def _request_sync(path: Path, timeout: float) -> tuple[dict, list[int]]:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(str(path))
+        sock.sendall(b"takeover\n")
+        data, fds, _, _ = socket.recv_fds(sock, 1024 * 1024, 4)
+        if len(data) < 4:
+            raise ConnectionError("old process closed the control socket")
+        (size,) = struct.unpack("!I", data[:4])
+        if size > _MAX_STATE:
+            raise ValueError(f"handoff state too large ({size} bytes)")
+        data = data[4:]
+        while len(data) < size:
+            more = sock.recv(size - len(data))
+            if not more:
+                raise ConnectionError("handoff state truncated")
+            data += more
+        state = json.loads(data)
+        sock.sendall(b"ok")
+    return state, fds
+
+
+async def request_takeover(path: Path, timeout: float = 300) -> tuple[dict, list[int]]:
+    """Ask the agent_vibe on path to hand over; returns its (state, fds). It exits afterwards."""
+    return await run_io(_request_sync, path, timeout)
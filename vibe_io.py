@@ -0,0 +1,151 @@
+"""
+Non-blocking file, subprocess and session I/O for agent_vibe.
+
+Anything that touches the (possibly slow, NFS) disk runs on IO_POOL, so the event loop
+keeps ingesting, sending and serving metrics while the filesystem lags. Telethon's SQLite
+session commits, closes and entity writes run on their own single thread (AsyncSQLiteSession).
+
+Short-lived scripts use SnapshotSession instead: a read-only copy of the session file in
+memory, so they never take its write lock and never block (or get blocked by) the daemons.
+
+VIBE_SLOW_IO=<seconds> adds that delay to every offloaded call. Combine with
+--stall-threshold to check that a slow disk only delays the task waiting for it,
+never the loop.
+"""
+import asyncio
+import datetime
+import os
+import sqlite3
+import time
+import urllib.parse
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from telethon import TelegramClient
+from telethon.crypto import AuthKey
+from telethon.sessions import MemorySession, SQLiteSession
+from telethon.tl import types
+
+IO_POOL = ThreadPoolExecutor(max_workers=4, thread_name_prefix="vibe-io")
+SLOW_IO = float(os.environ.get("VIBE_SLOW_IO", "0"))
+
+# Telethon warns on every awaitable session call; that's the point of AsyncSQLiteSession
+warnings.filterwarnings("ignore", message="Using async sessions support is an experimental feature")
+
+
+def _slow(fn, *args):
+    time.sleep(SLOW_IO)
+    return fn(*args)
+
+
+async def run_io(fn, *args, executor: ThreadPoolExecutor = IO_POOL):
+    """Run a blocking call on the I/O pool."""
+    if SLOW_IO:
+        return await asyncio.get_running_loop().run_in_executor(executor, _slow, fn, *args)
+    return await asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+
+
+async def read_text(path: Path) -> str:
+    """path.read_text(), or "" if the file doesn't exist."""
+    def read():
+        try:
+            return path.read_text()
+        except FileNotFoundError:
+            return ""
+    return await run_io(read)
+
+
+async def write_text(path: Path, data: str) -> None:
+    await run_io(path.write_text, data)
+
+
+async def run_subprocess(*cmd: str, cwd: Path, env: dict) -> tuple[int, str, str]:
+    """Run cmd to completion without blocking the loop; returns (returncode, stdout, stderr)."""
+    proc = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        cwd=cwd,
+        env=env,
+    )
+    out, err = await proc.communicate()
+    return proc.returncode or 0, out.decode(errors="replace"), err.decode(errors="replace")
+
+
+class AsyncSQLiteSession(SQLiteSession):
+    """SQLiteSession whose commits, closes and entity writes run off the event loop.
+
+    Telethon awaits these session calls when they return an awaitable. A single thread
+    keeps the writes on one connection in order.
+    """
+
+    _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="vibe-session")
+
+    def __init__(self, session_id=None, **kwargs):
+        self._offload = False  # SQLiteSession.__init__ calls save() and expects it to run now
+        super().__init__(session_id, **kwargs)
+        self._offload = True
+
+    def _run(self, fn, *args):
+        if not self._offload:
+            return fn(*args)
+        return run_io(fn, *args, executor=self._executor)
+
+    def save(self):
+        return self._run(super().save)
+
+    def close(self):
+        return self._run(super().close)
+
+    def process_entities(self, tlo):
+        return self._run(super().process_entities, tlo)
+
+
+class SnapshotSession(MemorySession):
+    """MemorySession loaded from a SQLite session file opened read-only.
+
+    Takes the auth key, DC, cached entities and update state from the file, so a one-shot
+    client needs no extra requests to resolve chats or initialize updates. Whatever it learns
+    stays in memory: the file is never written and no write lock is taken.
+    """
+
+    def __init__(self, session_id: str):
+        super().__init__()
+        filename = session_id if session_id.endswith(".session") else session_id + ".session"
+        if not os.path.exists(filename):
+            return  # Not logged in; the first request fails with an auth error
+        conn = sqlite3.connect(f"file:{urllib.parse.quote(filename)}?mode=ro", uri=True, timeout=10)
+        try:
+            row = conn.execute("select * from sessions").fetchone()
+            if row:
+                self._dc_id, self._server_address, self._port, key, self._takeout_id = row[:5]
+                self._auth_key = AuthKey(data=key)
+            self._entities = set(conn.execute("select id, hash, username, phone, name from entities"))
+            for entity_id, pts, qts, date, seq in conn.execute("select id, pts, qts, date, seq from update_state"):
+                date = datetime.datetime.fromtimestamp(date, tz=datetime.timezone.utc)
+                self._update_states[entity_id] = types.updates.State(pts, qts, date, seq, unread_count=0)
+        finally:
+            conn.close()
+
+
+def create_client(
+    tg, api_id: str | None = None, api_hash: str | None = None, snapshot: bool = False,
+) -> TelegramClient:
+    """Like Telegram.create_client(api_id, api_hash), but backed by AsyncSQLiteSession.
+
+    snapshot=True is for one-shot scripts: a SnapshotSession and no update handling, so the
+    script works while agent_vibe or an MCP server uses the same session. Check authorization
+    by catching telethon.errors.UnauthorizedError (is_user_authorized() costs a round trip).
+    """
+    if tg._client is None:
+        if api_id is None or api_hash is None:
+            from mcp_telegram.telegram import Settings
+            settings = Settings()  # API_ID / API_HASH from the environment
+            api_id, api_hash = settings.api_id, settings.api_hash.get_secret_value()
+        if snapshot:
+            session = SnapshotSession(str(tg.session_file))
+            tg._client = TelegramClient(session, int(api_id), api_hash, receive_updates=False)
+        else:
+            tg._client = TelegramClient(AsyncSQLiteSession(str(tg.session_file)), int(api_id), api_hash)
+    return tg._client
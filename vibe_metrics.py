@@ -0,0 +1,244 @@
+"""
+In-process metrics for agent_vibe and the MCP server: histograms, counters,
+a local Prometheus-style HTTP endpoint and a periodic one-line summary.
+
+No extra dependencies. The endpoint runs in a daemon thread so it keeps answering
+even when the event loop is busy (useful for spotting stalls).
+
+Usage:
+  from vibe_metrics import PHASE, timed, start_metrics_server
+  start_metrics_server(9101)              # http://127.0.0.1:9101/metrics
+  with timed("fetch"):
+      ...
+"""
+import asyncio
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# Seconds. Covers sub-100ms API calls up to hour-long agent runs.
+DEFAULT_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600,
+)
+
+
+def _label_str(names: tuple, values: tuple, extra: str = "") -> str:
+    parts = [f'{n}="{v}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    """Monotonic counter, optionally split by labels."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = tuple(str(labels.get(n, "")) for n in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def total(self) -> float:
+        with self._lock:
+            return sum(self._values.values())
+
+    def render(self) -> list[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_label_str(self.labels, k)} {v:g}" for k, v in items]
+
+
+class Histogram:
+    """Cumulative-bucket histogram (Prometheus semantics), optionally split by labels."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [bucket counts..., count, sum, max]
+        self._series: dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(str(labels.get(n, "")) for n in self.labels)
+        with self._lock:
+            s = self._series.get(key)
+            if s is None:
+                s = self._series[key] = [0] * len(self.buckets) + [0, 0.0, 0.0]
+            for i, b in enumerate(self.buckets):
+                if value <= b:
+                    s[i] += 1
+            n = len(self.buckets)
+            s[n] += 1
+            s[n + 1] += value
+            s[n + 2] = max(s[n + 2], value)
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def snapshot(self) -> dict[tuple, tuple[int, float, float]]:
+        """label values -> (count, sum, max)."""
+        n = len(self.buckets)
+        with self._lock:
+            return {k: (s[n], s[n + 1], s[n + 2]) for k, s in self._series.items()}
+
+    def render(self) -> list[str]:
+        n = len(self.buckets)
+        with self._lock:
+            items = sorted((k, list(s)) for k, s in self._series.items())
+        lines = []
+        for key, s in items:
+            for b, c in zip(self.buckets, s[:n]):
+                le = 'le="%g"' % b
+                lines.append(f"{self.name}_bucket{_label_str(self.labels, key, le)} {c}")
+            inf = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_label_str(self.labels, key, inf)} {s[n]}")
+            lines.append(f"{self.name}_count{_label_str(self.labels, key)} {s[n]}")
+            lines.append(f"{self.name}_sum{_label_str(self.labels, key)} {s[n + 1]:.6f}")
+        return lines
+
+
+class Registry:
+    """Named collection of metrics; get-or-create so modules can share series."""
+
+    def __init__(self):
+        self._metrics: dict[str, Counter | Histogram] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, help, labels, **kw):
+        with self._lock:
+            m = self._metrics.get(name)
+            if m is None:
+                m = self._metrics[name] = cls(name, help, labels, **kw)
+            return m
+
+    def counter(self, name: str, help: str, labels: tuple = ()) -> Counter:
+        return self._get(Counter, name, help, labels)
+
+    def histogram(self, name: str, help: str, labels: tuple = (), buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+        return self._get(Histogram, name, help, labels, buckets=buckets)
+
+    def render(self) -> str:
+        """Prometheus text exposition format."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        out = []
+        for m in metrics:
+            out.append(f"# HELP {m.name} {m.help}")
+            out.append(f"# TYPE {m.name} {m.kind}")
+            out.extend(m.render())
+        return "\n".join(out) + "\n"
+
+    def summary(self) -> str:
+        """One-line human summary: per-series count/avg/max and counter totals."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        parts = []
+        for m in metrics:
+            if isinstance(m, Histogram):
+                for key, (count, total, mx) in sorted(m.snapshot().items()):
+                    label = "/".join(key) or m.name
+                    parts.append(f"{label} n={count} avg={total / count:.2f}s max={mx:.2f}s")
+            else:
+                total = m.total()
+                if total:
+                    parts.append(f"{m.name}={total:g}")
+        return " | ".join(parts) if parts else "no data yet"
+
+
+REGISTRY = Registry()
+
+# Shared series. agent_vibe records its phases under PHASE, the MCP server its tools under TOOL.
+PHASE = REGISTRY.histogram("vibe_phase_seconds", "Time spent per agent_vibe phase", ("phase",))
+TOOL = REGISTRY.histogram("mcp_tool_seconds", "MCP tool call latency incl. reconnects", ("tool",))
+RETRIES = REGISTRY.counter("vibe_retries_total", "Retries after a locked session or dropped connection", ("op",))
+RECONNECTS = REGISTRY.counter("vibe_reconnects_total", "Reconnects after a connection error")
+FLOODWAITS = REGISTRY.counter("vibe_floodwaits_total", "FloodWait errors returned by Telegram", ("op",))
+DROPPED = REGISTRY.counter("vibe_dropped_messages_total", "Messages that were never delivered or processed", ("reason",))
+
+
+def timed(phase: str):
+    """Time a block under vibe_phase_seconds{phase=...}."""
+    return PHASE.time(phase=phase)
+
+
+def is_flood_wait(e: BaseException) -> bool:
+    """True for Telethon FloodWaitError (and premium/slowmode variants)."""
+    return type(e).__name__.startswith(("FloodWait", "FloodPremiumWait", "SlowModeWait"))
+
+
+# Extra GET routes: path -> handler(query dict) -> (status, content_type, body).
+ROUTES: dict = {}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path in ("/", "/metrics"):
+            status, ctype, body = 200, "text/plain; version=0.0.4", REGISTRY.render()
+        elif url.path == "/summary":
+            status, ctype, body = 200, "text/plain", REGISTRY.summary() + "\n"
+        elif url.path in ROUTES:
+            try:
+                status, ctype, body = ROUTES[url.path](parse_qs(url.query))
+            except Exception as e:
+                status, ctype, body = 500, "text/plain", f"{e}\n"
+        else:
+            status, ctype, body = 404, "text/plain", "not found\n"
+        data = body.encode() if isinstance(body, str) else body
+        self.send_response(status)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass  # Keep stdout clean (MCP uses it for the protocol)
+
+
+def start_metrics_server(port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer | None:
+    """Serve /metrics and /summary from a daemon thread. Returns None if the port is taken."""
+    try:
+        server = ThreadingHTTPServer((host, port), _Handler)
+    except OSError as e:
+        print(f"Metrics endpoint disabled ({host}:{port}): {e}", file=sys.stderr)
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="vibe-metrics", daemon=True).start()
+    return server
+
+
+async def log_summary_periodically(interval: float, file=sys.stderr) -> None:
+    """Print REGISTRY.summary() every `interval` seconds (run as a task)."""
+    while True:
+        await asyncio.sleep(interval)
+        print(f"[metrics] {REGISTRY.summary()}", file=file, flush=True)
+
+
+def start_summary_thread(interval: float, file=sys.stderr) -> None:
+    """Same as log_summary_periodically, for hosts where we don't own the event loop."""
+    def loop():
+        while True:
+            time.sleep(interval)
+            print(f"[metrics] {REGISTRY.summary()}", file=file, flush=True)
+
+    threading.Thread(target=loop, name="vibe-metrics-summary", daemon=True).start()
@@ -0,0 +1,154 @@
+"""
+Event-loop stall detection and an on-demand sampling profiler.
+
+- LoopStallDetector: the loop bumps a heartbeat every `threshold / 4` seconds; a watchdog
+  thread notices when it stops and prints the loop thread's stack *while it is blocked*
+  (e.g. a synchronous subprocess.run, a slow NFS read or a SQLite session write).
+- sample_profile(): samples one thread's stack every few ms and writes collapsed stacks
+  ("a;b;c 42" per line), ready for flamegraph.pl, inferno or speedscope.
+- install_profile_signal(): `kill -USR1 <pid>` profiles the loop thread for a window.
+- register_routes(): /debug/stacks and /debug/profile?seconds=N on the vibe_metrics endpoint.
+
+Idle cost: one timer callback per heartbeat and a sleeping thread; the profiler only
+runs while a profile is requested.
+"""
+import asyncio
+import os
+import signal
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+from pathlib import Path
+
+import vibe_metrics
+
+STALLS = vibe_metrics.REGISTRY.histogram(
+    "vibe_loop_stall_seconds", "Event-loop stalls longer than the detector threshold",
+)
+
+
+def _thread_stack(thread_id: int) -> list[str]:
+    frame = sys._current_frames().get(thread_id)
+    return traceback.format_stack(frame) if frame else ["<thread gone>\n"]
+
+
+class LoopStallDetector:
+    """Report the loop thread's stack whenever a callback blocks for more than `threshold` s."""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, threshold: float = 0.5, file=sys.stderr):
+        self.loop = loop
+        self.threshold = threshold
+        self.file = file
+        self._beat = time.monotonic()
+        self._thread_id = threading.get_ident()  # start() must run on the loop thread
+        self._stopped = threading.Event()
+
+    def start(self) -> "LoopStallDetector":
+        self._thread_id = threading.get_ident()
+        self.loop.call_soon(self._heartbeat)
+        threading.Thread(target=self._watch, name="vibe-stall-watchdog", daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+    def _heartbeat(self) -> None:
+        self._beat = time.monotonic()
+        if not self._stopped.is_set():
+            self.loop.call_later(self.threshold / 4, self._heartbeat)
+
+    def _watch(self) -> None:
+        reported_beat = None
+        while not self._stopped.wait(self.threshold / 4):
+            beat = self._beat
+            blocked = time.monotonic() - beat
+            if blocked > self.threshold and beat != reported_beat:
+                reported_beat = beat
+                stack = "".join(_thread_stack(self._thread_id))
+                print(
+                    f"[stall] event loop blocked for {blocked:.2f}s (threshold {self.threshold}s), "
+                    f"currently in:\n{stack}",
+                    file=self.file,
+                    flush=True,
+                )
+            elif reported_beat is not None and beat != reported_beat:
+                # Loop is back; record how long the reported stall really was
+                STALLS.observe(beat - reported_beat)
+                reported_beat = None
+
+
+def _fold(frame) -> str:
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({Path(code.co_filename).name}:{frame.f_lineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+def sample_profile(seconds: float, thread_id: int | None = None, interval: float = 0.005) -> str:
+    """Sample `thread_id` (default: main thread) for `seconds`; return collapsed stacks."""
+    if thread_id is None:
+        thread_id = threading.main_thread().ident
+    samples: Counter[str] = Counter()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        frame = sys._current_frames().get(thread_id)
+        if frame is not None:
+            samples[_fold(frame)] += 1
+        time.sleep(interval)
+    return "".join(f"{stack} {n}\n" for stack, n in samples.most_common())
+
+
+def write_profile(out_dir: Path, seconds: float, thread_id: int | None = None) -> Path:
+    """Run sample_profile and write it to out_dir/profile-<timestamp>.folded."""
+    folded = sample_profile(seconds, thread_id)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    path = out_dir / f"profile-{time.strftime('%Y%m%d-%H%M%S')}.folded"
+    path.write_text(folded)
+    return path
+
+
+def install_profile_signal(out_dir: Path, seconds: float = 30, signum: int = signal.SIGUSR1) -> None:
+    """`kill -USR1 <pid>` writes a profile of the main thread for `seconds`.
+
+    The signal is blocked for the process and consumed by a dedicated sigwait thread, so a
+    profile can be triggered even while the main thread is stuck in C code.
+    Call early, before other threads start (they inherit the blocked mask).
+    """
+    if not hasattr(signal, "pthread_sigmask"):
+        return
+    main_id = threading.main_thread().ident
+    signal.pthread_sigmask(signal.SIG_BLOCK, {signum})
+
+    def wait_loop():
+        while True:
+            signal.sigwait({signum})
+            print(f"[profile] sampling for {seconds}s (pid {os.getpid()})...", file=sys.stderr, flush=True)
+            path = write_profile(out_dir, seconds, main_id)
+            print(f"[profile] wrote {path}", file=sys.stderr, flush=True)
+
+    threading.Thread(target=wait_loop, name="vibe-profile-signal", daemon=True).start()
+
+
+def register_routes(thread_id: int | None = None) -> None:
+    """Add /debug/stacks and /debug/profile?seconds=N to the vibe_metrics endpoint."""
+    if thread_id is None:
+        thread_id = threading.main_thread().ident
+
+    def stacks(query):
+        names = {t.ident: t.name for t in threading.enumerate()}
+        out = []
+        for tid in sys._current_frames():
+            out.append(f"--- {names.get(tid, tid)} ---\n")
+            out.extend(_thread_stack(tid))
+        return 200, "text/plain", "".join(out)
+
+    def profile(query):
+        seconds = min(float(query.get("seconds", ["10"])[0]), 300)
+        return 200, "text/plain", sample_profile(seconds, thread_id)
+
+    vibe_metrics.ROUTES["/debug/stacks"] = stacks
+    vibe_metrics.ROUTES["/debug/profile"] = profile
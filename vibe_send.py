@@ -0,0 +1,127 @@
+"""
+Idempotent text sends.
+
+Every message gets its MTProto random_id from a client-side idempotency key instead of a
+fresh random number. Telegram rejects a second message with a random_id it has already seen
+from this account (RANDOM_ID_DUPLICATE), so resending after a timeout or reconnect with the
+same key can't post the message twice — the duplicate error means the first attempt got
+through. That also makes pipelining safe: send_texts() puts several messages on the wire at
+once and resends only the ones that failed.
+
+Requests go straight to the client's sender: client(request) would retry RANDOM_ID_DUPLICATE
+(a ServerError) five times and then fail, for a message that was sent. Like client(request),
+a FloodWait up to client.flood_sleep_threshold is slept out and the message resent with the
+same key; longer ones are raised, so a session pool can move to another session.
+
+Usage:
+  key = new_key()               # once per logical message, outside any retry loop
+  await send_text(client, entity, "[bot] Done", key)
+  errors = await send_texts(client, entity, [(key1, text1), (key2, text2)], sent=set())
+"""
+import asyncio
+import hashlib
+import uuid
+
+from telethon import TelegramClient
+from telethon.errors import FloodPremiumWaitError, FloodWaitError, RandomIdDuplicateError, RPCError, SlowModeWaitError
+from telethon.tl import functions, types
+
+
+def new_key() -> str:
+    return uuid.uuid4().hex
+
+
+def random_id_for(key: str) -> int:
+    """Signed 64-bit random_id derived from an idempotency key."""
+    return int.from_bytes(hashlib.sha256(key.encode()).digest()[:8], "big", signed=True)
+
+
+def _request(client: TelegramClient, peer, text: str, key: str, reply_to: int | None = None):
+    message, entities = client.parse_mode.parse(text) if client.parse_mode else (text, [])
+    return functions.messages.SendMessageRequest(
+        peer=peer,
+        message=message,
+        entities=entities or None,
+        reply_to=types.InputReplyToMessage(reply_to_msg_id=reply_to) if reply_to else None,
+        random_id=random_id_for(key),
+    )
+
+
+_FLOOD_WAITS = (FloodWaitError, FloodPremiumWaitError, SlowModeWaitError)
+
+
+async def _invoke(client: TelegramClient, requests: list, ordered: bool = False) -> list[Exception | None]:
+    """Send requests once; the error per request (None = ok, or a duplicate of a sent one).
+    That is Telegram's RPCError, or a connection error after which resending is safe.
+    """
+    results = await asyncio.gather(*client._sender.send(requests, ordered=ordered), return_exceptions=True)
+    errors = []
+    for result in results:
+        if isinstance(result, RandomIdDuplicateError) or not isinstance(result, BaseException):
+            errors.append(None)
+        elif isinstance(result, Exception):
+            errors.append(result)
+        else:
+            raise result  # Cancelled
+    return errors
+
+
+def _sleep_for(client: TelegramClient, err: Exception) -> float | None:
+    """Seconds to wait before resending after err, or None if it shouldn't be resent here."""
+    if isinstance(err, _FLOOD_WAITS) and err.seconds <= client.flood_sleep_threshold:
+        return max(err.seconds, 1)  # FLOOD_WAIT_0 happens; resending at once floods again
+    return None
+
+
+async def send_text(client: TelegramClient, entity, text: str, key: str, reply_to: int | None = None) -> None:
+    """Send text with the random_id for key; a duplicate of an earlier attempt counts as sent."""
+    peer = await client.get_input_entity(entity)
+    request = _request(client, peer, text, key, reply_to)
+    while True:
+        (err,) = await _invoke(client, [request])
+        if err is None:
+            return
+        wait = _sleep_for(client, err)
+        if wait is None:
+            raise err
+        await asyncio.sleep(wait)
+
+
+async def send_texts(
+    client: TelegramClient, entity, items: list[tuple[str, str]], sent: set[str] | None = None,
+) -> list[Exception | None]:
+    """Send (key, text) items in order, pipelined on one connection.
+
+    Items Telegram rejects are resent once, one by one, with the same keys (waiting out
+    short FloodWaits). Returns the error per item (None = sent), so one bad message doesn't
+    stop the rest. A longer FloodWait or a connection error is raised; keys that went
+    through are added to `sent` first and skipped on the next call, so resending the batch
+    (from another session, where the keys don't deduplicate) only sends the rest.
+    """
+    sent = set() if sent is None else sent
+    todo = [i for i, (key, _) in enumerate(items) if key not in sent]
+    errors: list[Exception | None] = [None] * len(items)
+    if not todo:
+        return errors
+    peer = await client.get_input_entity(entity)
+    first = await _invoke(client, [_request(client, peer, items[i][1], items[i][0]) for i in todo], ordered=True)
+    for i, err in zip(todo, first):
+        if err is None:
+            sent.add(items[i][0])
+    for err in first:
+        if err is not None and not isinstance(err, RPCError):
+            raise err
+    for i, err in zip(todo, first):
+        if err is None:
+            continue
+        if isinstance(err, _FLOOD_WAITS) and _sleep_for(client, err) is None:
+            raise err
+        key, text = items[i]  # With ordered=True, later items can fail just because this one did
+        try:
+            await send_text(client, entity, text, key)
+            sent.add(key)
+        except _FLOOD_WAITS:
+            raise
+        except RPCError as retry_err:
+            errors[i] = retry_err
+    return errors
@@ -0,0 +1,143 @@
+"""
+Bounded-memory capture of agent output: one rotating log file per task, written on the
+vibe_io pool with backpressure, plus an in-memory ring buffer with the last few KB.
+
+Memory per task is ring_bytes + max_pending * chunk size, however much the agent prints.
+
+Usage:
+  logs = TaskLogs(PROJECT_DIR / ".vibe-logs" / dialog)
+  log = logs.open("1234")
+  await log.write(chunk)        # waits when the disk can't keep up
+  await log.close()
+  logs.get("1234").tail()       # last ring_bytes of output
+"""
+import asyncio
+import os
+import sys
+from collections import OrderedDict
+from pathlib import Path
+
+from vibe_io import run_io
+
+
+class TaskLog:
+    """Output of one task: task-<id>.log (+ .1, .2 when rotated) and a ring buffer."""
+
+    def __init__(
+        self,
+        task_id: str,
+        log_dir: Path,
+        ring_bytes: int = 64 * 1024,
+        max_bytes: int = 20 * 1024 * 1024,
+        backups: int = 2,
+        max_pending: int = 64,
+    ):
+        self.task_id = task_id
+        self.path = log_dir / f"task-{task_id}.log"
+        self.ring_bytes = ring_bytes
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.total_bytes = 0
+        self._ring = bytearray()
+        self._pending: asyncio.Queue[bytes | None] = asyncio.Queue(max_pending)
+        self._file = None
+        self._closing = False
+        self._writer = asyncio.create_task(self._drain())
+
+    async def write(self, data: bytes) -> None:
+        """Append output. Blocks (backpressure) while max_pending chunks await the disk."""
+        self.total_bytes += len(data)
+        self._ring += data
+        if len(self._ring) > self.ring_bytes:
+            del self._ring[: len(self._ring) - self.ring_bytes]
+        await self._pending.put(data)
+
+    def tail(self, n_bytes: int | None = None) -> str:
+        data = bytes(self._ring if n_bytes is None else self._ring[-n_bytes:])
+        return data.decode(errors="replace")
+
+    async def close(self) -> None:
+        """Flush pending chunks and close the file. Safe to call more than once, concurrently."""
+        if not self._closing:
+            self._closing = True
+            await self._pending.put(None)
+        await self._writer
+
+    async def _drain(self) -> None:
+        done = False
+        while not done:
+            chunks = [await self._pending.get()]
+            while not self._pending.empty():  # Coalesce whatever queued up into one write
+                chunks.append(self._pending.get_nowait())
+            if chunks[-1] is None:
+                chunks.pop()
+                done = True
+            try:
+                await run_io(self._write_sync, b"".join(chunks), done)
+            except OSError as e:
+                print(f"Task log write failed ({self.path}): {e}", file=sys.stderr)
+
+    def _write_sync(self, data: bytes, close: bool) -> None:
+        if self._file is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._file = open(self.path, "ab")
+        if data:
+            if self._file.tell() + len(data) > self.max_bytes and self._file.tell():
+                self._rotate()
+            self._file.write(data)
+            self._file.flush()
+        if close:
+            self._file.close()
+
+    def _rotate(self) -> None:
+        self._file.close()
+        for i in range(self.backups, 0, -1):
+            src = self.path.with_name(f"{self.path.name}.{i - 1}" if i > 1 else self.path.name)
+            if src.exists():
+                os.replace(src, self.path.with_name(f"{self.path.name}.{i}"))
+        self._file = open(self.path, "ab")
+
+
+class TaskLogs:
+    """Recent TaskLogs by id. Older tasks drop their ring buffer but keep their files."""
+
+    def __init__(self, log_dir: Path, keep_in_memory: int = 20, keep_on_disk: int = 200, **log_kwargs):
+        self.log_dir = log_dir
+        self.keep_in_memory = keep_in_memory
+        self.keep_on_disk = keep_on_disk
+        self.log_kwargs = log_kwargs
+        self._logs: OrderedDict[str, TaskLog] = OrderedDict()
+
+    def open(self, task_id: str) -> TaskLog:
+        log = TaskLog(task_id, self.log_dir, **self.log_kwargs)
+        self._logs[task_id] = log
+        while len(self._logs) > self.keep_in_memory:
+            self._logs.popitem(last=False)
+        asyncio.create_task(run_io(self._prune))
+        return log
+
+    def get(self, task_id: str | None = None) -> TaskLog | None:
+        """Log for task_id, or the most recent task when task_id is None."""
+        if task_id is None:
+            return next(reversed(self._logs.values()), None)
+        return self._logs.get(task_id)
+
+    def path(self, task_id: str | None = None) -> Path | None:
+        """Log file for task_id (default: most recent), also for tasks no longer held in memory."""
+        if task_id is None:
+            latest = self.get()
+            if latest is None:
+                return None
+            task_id = latest.task_id
+        path = self.log_dir / f"task-{task_id}.log"
+        return path if path.exists() else None
+
+    def _prune(self) -> None:
+        try:
+            files = sorted(self.log_dir.glob("task-*.log*"), key=lambda p: p.stat().st_mtime)
+        except OSError:
+            return
+        tasks = list(dict.fromkeys(p.name.split(".log")[0] for p in files))
+        for old in tasks[: max(0, len(tasks) - self.keep_on_disk)]:
+            for p in self.log_dir.glob(f"{old}.log*"):
+                p.unlink(missing_ok=True)